@@ -194,7 +194,7 @@ async def orb(image_template: UploadFile = File(...), image_target: UploadFile =
     try:
         template_img = read_image_from_upload(image_template)
         target_img = read_image_from_upload(image_target)
-        result = aligner.align(template_img, target_img)
+        result = aligner.align(template_img, target_img, visualize=True)
         json_result = prepare_response(result)
         return json_result
     except Exception as e:
@@ -238,8 +238,8 @@ def prepare_response(result):
     response = {
         "success": True,
         "aligned_image_base64": encode_image_to_base64(result["aligned_image"]),
-        "visualization_image_base64": encode_image_to_base64(result["visualization_image"]),
-        "comparison_image_base64": encode_image_to_base64(result["comparison_image"]),
+        "visualization_image_base64": encode_image_to_base64(result["visuals"].visualization()),
+        "comparison_image_base64": encode_image_to_base64(result["visuals"].comparison()),
         "original_sizes": {
             "base": list(result["original_sizes"]["base"]),
             "target": list(result["original_sizes"]["target"])
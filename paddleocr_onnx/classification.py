@@ -1,18 +1,15 @@
 import math
-import os
 import cv2
 import numpy
 
+from .utils import aspect_ratios, create_session
+
 
 class Classification:
-    def __init__(self, onnx_path, session=None):
+    def __init__(self, onnx_path, session=None, session_options=None):
         self.session = session
         if self.session is None:
-            assert onnx_path is not None
-            assert os.path.exists(onnx_path)
-            from onnxruntime import InferenceSession
-            self.session = InferenceSession(onnx_path,
-                                            providers=['CUDAExecutionProvider'])
+            self.session = create_session(onnx_path, options=session_options)
         self.inputs = self.session.get_inputs()[0]
         self.threshold = 0.98
         self.labels = ['0', '180']
@@ -29,25 +26,17 @@ class Classification:
             resized_w = input_w
         else:
             resized_w = int(math.ceil(input_h * ratio))
-        resized_image = cv2.resize(image, (resized_w, input_h))
-
-        if input_c == 1:
-            resized_image = resized_image[numpy.newaxis, :]
-
-        resized_image = resized_image.transpose((2, 0, 1))
-        resized_image = resized_image.astype('float32')
-        resized_image = resized_image / 255.0
-        resized_image -= 0.5
-        resized_image /= 0.5
+        # resize + (x / 255 - 0.5) / 0.5 + HWC->CHW in one pass
         padded_image = numpy.zeros((input_c, input_h, input_w), dtype=numpy.float32)
-        padded_image[:, :, 0:resized_w] = resized_image
+        padded_image[:, :, 0:resized_w] = cv2.dnn.blobFromImage(image, 1.0 / 127.5, (resized_w, input_h),
+                                                                (127.5, 127.5, 127.5))[0]
         return padded_image
 
     def __call__(self, images):
         num_images = len(images)
 
-        results = [['', 0.0]] * num_images
-        indices = numpy.argsort(numpy.array([x.shape[1] / x.shape[0] for x in images]))
+        results = [None] * num_images
+        indices = numpy.argsort(aspect_ratios(images))
 
         batch_size = 6
         for i in range(0, num_images, batch_size):
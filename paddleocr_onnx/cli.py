@@ -28,6 +28,10 @@ def main():
                        help='Path to custom recognition ONNX model')
     parser.add_argument('--classification-model', type=str,
                        help='Path to custom classification ONNX model')
+    parser.add_argument('--rec-batch-size', type=int, default=None,
+                       help='Recognition batch size (default: 32 on CUDA, 8 on CPU)')
+    parser.add_argument('-j', '--prefetch', type=int, default=4,
+                       help='Number of images decoded ahead of inference (default: 4)')
     parser.add_argument('-v', '--verbose', action='store_true',
                        help='Enable verbose output')
 
@@ -43,7 +47,8 @@ def main():
         ocr = OCRProcessor(
             detection_model_path=args.detection_model,
             recognition_model_path=args.recognition_model,
-            classification_model_path=args.classification_model
+            classification_model_path=args.classification_model,
+            recognition_batch_size=args.rec_batch_size
         )
     except Exception as e:
         print(f"Error initializing OCR processor: {e}")
@@ -76,7 +81,8 @@ def main():
                 
         elif os.path.isdir(args.input_path):
             # Process directory
-            results = ocr.process_directory(args.input_path, args.output)
+            results = ocr.process_directory(args.input_path, args.output,
+                                            prefetch=args.prefetch, draw_results=draw_results)
             
             print(f"Processing directory: {args.input_path}")
             print(f"Processed {len(results)} images")
@@ -1,20 +1,18 @@
 import math
-import os
+import threading
 import cv2
 import numpy
 from pyclipper import PyclipperOffset, JT_ROUND, ET_CLOSEDPOLYGON
 from shapely.geometry import Polygon
 
+from .utils import create_session
+
 
 class Detection:
-    def __init__(self, onnx_path, session=None):
+    def __init__(self, onnx_path, session=None, session_options=None):
         self.session = session
         if self.session is None:
-            assert onnx_path is not None
-            assert os.path.exists(onnx_path)
-            from onnxruntime import InferenceSession
-            self.session = InferenceSession(onnx_path,
-                                            providers=['CUDAExecutionProvider'])
+            self.session = create_session(onnx_path, options=session_options)
 
         self.inputs = self.session.get_inputs()[0]
 
@@ -23,6 +21,10 @@ class Detection:
         self.box_thresh = 0.8
         self.mask_thresh = 0.8
 
+        # scratch mask reused by box_score, grown on demand; one per thread so a
+        # shared OCRProcessor can be called from several threads
+        self._scratch = threading.local()
+
         self.mean = numpy.array([123.675, 116.28, 103.53])  # imagenet mean
         self.mean = self.mean.reshape(1, -1).astype('float64')
 
@@ -32,7 +34,8 @@ class Detection:
     def filter_polygon(self, points, shape):
         width = shape[1]
         height = shape[0]
-        filtered_points = []
+        filtered_points = numpy.empty((len(points), 4, 2), dtype="float32")
+        k = 0
         for point in points:
             if type(point) is list:
                 point = numpy.array(point)
@@ -42,8 +45,9 @@ class Detection:
             h = int(numpy.linalg.norm(point[0] - point[3]))
             if w <= 3 or h <= 3:
                 continue
-            filtered_points.append(point)
-        return numpy.array(filtered_points)
+            filtered_points[k] = point
+            k += 1
+        return filtered_points[:k]
 
     def boxes_from_bitmap(self, output, mask, dest_width, dest_height):
         mask = (mask * 255).astype(numpy.uint8)
@@ -55,8 +59,9 @@ class Detection:
         else:
             contours = outs[1]
 
-        boxes = []
-        scores = []
+        boxes = numpy.empty((len(contours), 4, 2), dtype="int32")
+        scores = numpy.empty(len(contours), dtype="float32")
+        k = 0
         for index in range(len(contours)):
             contour = contours[index]
             points, min_side = self.get_min_boxes(contour)
@@ -80,33 +85,25 @@ class Detection:
 
             box[:, 0] = numpy.clip(numpy.round(box[:, 0] / width * dest_width), 0, dest_width)
             box[:, 1] = numpy.clip(numpy.round(box[:, 1] / height * dest_height), 0, dest_height)
-            boxes.append(box.astype("int32"))
-            scores.append(score)
-        return numpy.array(boxes, dtype="int32"), scores
+            boxes[k] = box
+            scores[k] = score
+            k += 1
+        return boxes[:k], scores[:k]
 
     @staticmethod
     def get_min_boxes(contour):
         bounding_box = cv2.minAreaRect(contour)
-        points = sorted(list(cv2.boxPoints(bounding_box)), key=lambda x: x[0])
+        points = cv2.boxPoints(bounding_box)
+        points = points[numpy.argsort(points[:, 0], kind='stable')]
 
-        if points[1][1] > points[0][1]:
-            index_1 = 0
-            index_4 = 1
-        else:
-            index_1 = 1
-            index_4 = 0
-        if points[3][1] > points[2][1]:
-            index_2 = 2
-            index_3 = 3
-        else:
-            index_2 = 3
-            index_3 = 2
+        # top-left / bottom-left from the two left-most points, same for the right pair
+        index_1 = int(points[1, 1] <= points[0, 1])
+        index_2 = int(points[3, 1] <= points[2, 1])
 
-        box = [points[index_1], points[index_2], points[index_3], points[index_4]]
+        box = points[[index_1, 2 + index_2, 3 - index_2, 1 - index_1]]
         return box, min(bounding_box[1])
 
-    @staticmethod
-    def box_score(bitmap, contour):
+    def box_score(self, bitmap, contour):
         h, w = bitmap.shape[:2]
         contour = contour.copy()
         contour = numpy.reshape(contour, (-1, 2))
@@ -116,7 +113,12 @@ class Detection:
         x2 = numpy.clip(numpy.max(contour[:, 0]), 0, w - 1)
         y2 = numpy.clip(numpy.max(contour[:, 1]), 0, h - 1)
 
-        mask = numpy.zeros((y2 - y1 + 1, x2 - x1 + 1), dtype=numpy.uint8)
+        score_mask = getattr(self._scratch, 'score_mask', None)
+        if score_mask is None or y2 - y1 + 1 > score_mask.shape[0] or x2 - x1 + 1 > score_mask.shape[1]:
+            size = max(h, w, self.max_size)
+            score_mask = self._scratch.score_mask = numpy.empty((size, size), numpy.uint8)
+        mask = score_mask[:y2 - y1 + 1, :x2 - x1 + 1]
+        mask.fill(0)
 
         contour[:, 0] = contour[:, 0] - x1
         contour[:, 1] = contour[:, 1] - y1
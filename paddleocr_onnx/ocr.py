@@ -1,13 +1,15 @@
 import os
 import sys
-from typing import List, Tuple, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Tuple, Optional
 import cv2
 import numpy as np
 
 from .detection import Detection
 from .recognition import Recognition
 from .classification import Classification
-from .utils import sort_polygon, crop_image
+from .utils import sort_polygon, crop_images, crop_sizes, create_session_options
 
 
 def resource_path(relative_path: str) -> str:
@@ -34,7 +36,11 @@ class OCRProcessor:
     def __init__(self, 
                  detection_model_path: Optional[str] = None,
                  recognition_model_path: Optional[str] = None,
-                 classification_model_path: Optional[str] = None):
+                 classification_model_path: Optional[str] = None,
+                 recognition_batch_size: Optional[int] = None,
+                 recognition_cuda_graph: bool = False,
+                 recognition_precision: str = 'fp32',
+                 skip_classification_for_wide_crops: bool = False):
         """
         Initialize the OCR processor.
         
@@ -42,6 +48,13 @@ class OCRProcessor:
             detection_model_path: Path to detection ONNX model
             recognition_model_path: Path to recognition ONNX model  
             classification_model_path: Path to classification ONNX model
+            recognition_batch_size: Crops per recognition batch (default: 32 on CUDA, 8 on CPU)
+            recognition_cuda_graph: Capture CUDA graphs for recognition batches (CUDA only)
+            recognition_precision: 'fp32', 'fp16' (CUDA) or 'int8' (CPU); reduced-precision
+                models are converted next to the original on first use
+            skip_classification_for_wide_crops: Only run the orientation classifier on
+                crops whose detected box is at least ``tall_crop_ratio`` times taller than
+                wide (the ones crop_images rotates); wide boxes are assumed upright
         """
         # Use default model paths if not provided
         if detection_model_path is None:
@@ -51,10 +64,17 @@ class OCRProcessor:
         if classification_model_path is None:
             classification_model_path = resource_path('weights/classification.onnx')
             
-        # Initialize models
-        self.detection = Detection(detection_model_path)
-        self.recognition = Recognition(recognition_model_path)
-        self.classification = Classification(classification_model_path)
+        # Initialize models; the three sessions share one CPU arena and thread setup
+        session_options = create_session_options(shared=True)
+        self.detection = Detection(detection_model_path, session_options=session_options)
+        self.recognition = Recognition(recognition_model_path,
+                                       batch_size=recognition_batch_size,
+                                       cuda_graph=recognition_cuda_graph,
+                                       precision=recognition_precision,
+                                       session_options=session_options)
+        self.classification = Classification(classification_model_path, session_options=session_options)
+        self.skip_classification_for_wide_crops = skip_classification_for_wide_crops
+        self.tall_crop_ratio = 1.5
     
     def process_image(self, 
                      image_path: str, 
@@ -93,9 +113,17 @@ class OCRProcessor:
         Returns:
             List of tuples containing (text, confidence) for each detected text region
         """
-        image = frame.copy()
+        results, image = self._process_frame(frame, draw_results)
         
-        # Convert BGR to RGB for processing
+        # Save output image if path provided
+        if output_path and image is not None:
+            cv2.imwrite(output_path, image)
+        
+        return results
+    
+    def _process_frame(self, frame: np.ndarray, draw_results: bool):
+        """Run the OCR pipeline; returns (results, output image or None when nothing was found)."""
+        # Convert BGR to RGB for processing; ``frame`` itself is left untouched
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         
         # Detect text regions
@@ -103,57 +131,96 @@ class OCRProcessor:
         points = sort_polygon(list(points))
         
         if not points:
-            return []
+            return [], None
         
         # Crop detected regions
-        cropped_images = [crop_image(rgb_frame, x) for x in points]
+        cropped_images = crop_images(rgb_frame, points)
         
         # Classify orientation and rotate if needed
-        cropped_images, angles = self.classification(cropped_images)
+        if self.skip_classification_for_wide_crops:
+            # crop_images already rotates tall crops, so decide from the box geometry
+            widths, heights = crop_sizes(points)
+            tall = np.flatnonzero(heights >= self.tall_crop_ratio * widths).tolist()
+            if tall:
+                rotated, _ = self.classification([cropped_images[i] for i in tall])
+                for i, image in zip(tall, rotated):
+                    cropped_images[i] = image
+        else:
+            cropped_images, angles = self.classification(cropped_images)
         
         # Recognize text
         results, confidences = self.recognition(cropped_images)
         
-        # Draw results on image if requested
+        # Draw results on a copy of the frame only if requested
+        image = frame
         if draw_results:
+            image = frame.copy()
             self._draw_results(image, points, results)
         
-        # Save output image if path provided
-        if output_path:
-            cv2.imwrite(output_path, image)
-        
         # Return results with confidences
-        return list(zip(results, confidences))
+        return list(zip(results, confidences)), image
     
     def _draw_results(self, image: np.ndarray, points: List, results: List[str]):
         """Draw detection boxes and recognized text on image."""
-        for i, result in enumerate(results):
-            if i < len(points):
-                point = np.array(points[i], dtype=np.int32)
-                
-                # Draw polygon
-                cv2.polylines(image, [point], True, (0, 255, 0), 2)
-                
-                # Draw text
-                x, y, w, h = cv2.boundingRect(point)
-                image = cv2.putText(image, result, (int(x), int(y - 2)), 
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 0), 1, cv2.LINE_AA)
+        count = min(len(points), len(results))
+        if count == 0:
+            return
+        polygons = np.asarray(points[:count], dtype=np.int32)
+        
+        # Draw all polygons in one call
+        cv2.polylines(image, list(polygons), True, (0, 255, 0), 2)
+        
+        # Draw text at the top-left corner of each box
+        origins = polygons.min(axis=1)
+        for result, (x, y) in zip(results, origins):
+            cv2.putText(image, result, (int(x), int(y - 2)), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 0), 1, cv2.LINE_AA)
     
     def process_directory(self, 
                          directory_path: str, 
                          output_dir: Optional[str] = None,
-                         image_extensions: Tuple[str, ...] = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp')) -> List[Tuple[str, List[Tuple[str, float]]]]:
+                         image_extensions: Tuple[str, ...] = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'),
+                         prefetch: int = 4,
+                         draw_results: bool = True) -> List[Tuple[str, List[Tuple[str, float]]]]:
         """
         Process all images in a directory.
         
+        Collects the output of :meth:`iter_directory` into a list.
+        
         Args:
             directory_path: Path to directory containing images
             output_dir: Directory to save output images (optional)
             image_extensions: Tuple of valid image extensions
+            prefetch: Number of images decoded ahead of inference
+            draw_results: Whether to draw detection boxes and text on output images
             
         Returns:
             List of tuples containing (filename, results) for each processed image
         """
+        return list(self.iter_directory(directory_path, output_dir, image_extensions, prefetch, draw_results))
+    
+    def iter_directory(self, 
+                       directory_path: str, 
+                       output_dir: Optional[str] = None,
+                       image_extensions: Tuple[str, ...] = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'),
+                       prefetch: int = 4,
+                       draw_results: bool = True) -> Iterator[Tuple[str, List[Tuple[str, float]]]]:
+        """
+        Process all images in a directory, yielding results as each image finishes.
+        
+        The next ``prefetch`` images are decoded on a thread pool while the
+        current one is being processed.
+        
+        Args:
+            directory_path: Path to directory containing images
+            output_dir: Directory to save output images (optional)
+            image_extensions: Tuple of valid image extensions
+            prefetch: Number of images decoded ahead of inference
+            draw_results: Whether to draw detection boxes and text on output images
+            
+        Yields:
+            Tuples of (filename, results) for each processed image
+        """
         if not os.path.isdir(directory_path):
             raise ValueError(f"Directory not found: {directory_path}")
         
@@ -161,26 +228,54 @@ class OCRProcessor:
         if output_dir:
             os.makedirs(output_dir, exist_ok=True)
         
-        # Get all image files
-        image_files = [f for f in os.listdir(directory_path) 
-                      if f.lower().endswith(image_extensions)]
-        
-        all_results = []
+        # Get all image files, in name order
+        image_files = sorted(f for f in os.listdir(directory_path) 
+                             if f.lower().endswith(image_extensions))
         
-        for image_file in image_files:
-            full_path = os.path.join(directory_path, image_file)
-            output_path = None
+        with ThreadPoolExecutor(max_workers=max(1, prefetch)) as executor, \
+                ThreadPoolExecutor(max_workers=2) as writer:
+            files = iter(image_files)
+            pending = deque()
+            writes = deque()
+            
+            def submit_next():
+                image_file = next(files, None)
+                if image_file is not None:
+                    full_path = os.path.join(directory_path, image_file)
+                    pending.append((image_file, executor.submit(cv2.imread, full_path)))
+            
+            def wait_write():
+                image_file, write = writes.popleft()
+                try:
+                    write.result()
+                except Exception as e:
+                    print(f"Error writing output for {image_file}: {e}")
             
-            if output_dir:
-                output_filename = f"output_{image_file}"
-                output_path = os.path.join(output_dir, output_filename)
+            for _ in range(max(1, prefetch)):
+                submit_next()
+            
+            while pending:
+                image_file, future = pending.popleft()
+                submit_next()
+                
+                try:
+                    frame = future.result()
+                    if frame is None:
+                        raise ValueError(f"Could not read image: {image_file}")
+                    # Annotated copy only when it is written out
+                    results, image = self._process_frame(frame, draw_results and bool(output_dir))
+                    print(f"Processed {image_file}: {[r[0] for r in results]}")
+                except Exception as e:
+                    print(f"Error processing {image_file}: {e}")
+                    results, image = [], None
+                
+                # Encode and write the annotated image off the inference thread
+                if output_dir and image is not None:
+                    if len(writes) >= 8:
+                        wait_write()
+                    output_path = os.path.join(output_dir, f"output_{image_file}")
+                    writes.append((image_file, writer.submit(cv2.imwrite, output_path, image)))
+                yield image_file, results
             
-            try:
-                results = self.process_image(full_path, output_path)
-                all_results.append((image_file, results))
-                print(f"Processed {image_file}: {[r[0] for r in results]}")
-            except Exception as e:
-                print(f"Error processing {image_file}: {e}")
-                all_results.append((image_file, []))
-        
-        return all_results
+            while writes:
+                wait_write()
@@ -1,33 +1,64 @@
 import math
 import os
+import threading
+from collections import OrderedDict
 import cv2
 import numpy
-from .utils import CTCDecoder
+from onnxruntime import OrtValue, RunOptions
+
+from .utils import CTCDecoder, aspect_ratios, convert_model, create_session
 
 
 class Recognition:
-    def __init__(self, onnx_path, session=None):
+    def __init__(self, onnx_path, session=None, batch_size=None, cuda_graph=False, precision='fp32',
+                 session_options=None):
         self.session = session
         if self.session is None:
             assert onnx_path is not None
             assert os.path.exists(onnx_path)
-            from onnxruntime import InferenceSession
-            self.session = InferenceSession(onnx_path,
-                                            providers=['CUDAExecutionProvider'])
+            self.session = create_session(convert_model(onnx_path, precision),
+                                          cuda_graph=cuda_graph, options=session_options)
         self.inputs = self.session.get_inputs()[0]
+        self.outputs = self.session.get_outputs()[0]
         self.input_shape = [3, 48, 320]
         self.ctc_decoder = CTCDecoder()
+        # start a new batch once the aspect ratio grows by more than this factor
+        self.bucket_ratio = 1.15
 
-    def resize(self, image, max_wh_ratio):
-        input_h, input_w = self.input_shape[1], self.input_shape[2]
+        use_cuda = 'CUDAExecutionProvider' in self.session.get_providers()
+        if batch_size is None:
+            batch_size = 32 if use_cuda else 8
+        self.batch_size = batch_size
+        # per-thread flat float32 storage reused for every batch tensor, grown on
+        # demand (one Recognition is called from pooled threads)
+        self._scratch = threading.local()
 
-        assert self.input_shape[0] == image.shape[2]
-        input_w = int((input_h * max_wh_ratio))
+        # on CUDA, keep one device input tensor per batch shape (width buckets
+        # repeat) and bind it instead of handing a host array to every session.run;
+        # widths are not quantised without CUDA graphs, so only the most recent shapes are kept.
+        # The binding and device inputs are per thread, like the batch buffer
+        self.use_io_binding = use_cuda
+        self.max_device_inputs = 16
+
+        # with CUDA graphs every batch is padded to batch_size x a multiple of
+        # graph_width_step, and one graph is captured per padded width
+        self.graph_width_step = 160
+        self._graphs = {} if cuda_graph and use_cuda else None
+
+    def input_width(self, max_wh_ratio):
+        input_w = int((self.input_shape[1] * max_wh_ratio))
         w = self.inputs.shape[3:][0]
         if isinstance(w, str):
             pass
         elif w is not None and w > 0:
             input_w = w
+        return input_w
+
+    def resize(self, image, max_wh_ratio, out=None):
+        input_h = self.input_shape[1]
+
+        assert self.input_shape[0] == image.shape[2]
+        input_w = self.input_width(max_wh_ratio)
         h, w = image.shape[:2]
         ratio = w / float(h)
         if math.ceil(input_h * ratio) > input_w:
@@ -35,40 +66,110 @@ class Recognition:
         else:
             resized_w = int(math.ceil(input_h * ratio))
 
-        resized_image = cv2.resize(image, (resized_w, input_h))
-        resized_image = resized_image.transpose((2, 0, 1))
-        resized_image = resized_image.astype('float32')
-        resized_image = resized_image / 255.0
-        resized_image -= 0.5
-        resized_image /= 0.5
-        padded_image = numpy.zeros((self.input_shape[0], input_h, input_w), dtype=numpy.float32)
-        padded_image[:, :, 0:resized_w] = resized_image
-        return padded_image
+        if out is None:
+            out = numpy.zeros((self.input_shape[0], input_h, input_w), dtype=numpy.float32)
+
+        # resize + (x / 255 - 0.5) / 0.5 + HWC->CHW in one pass
+        out[:, :, 0:resized_w] = cv2.dnn.blobFromImage(image, 1.0 / 127.5, (resized_w, input_h),
+                                                       (127.5, 127.5, 127.5))[0]
+        return out
+
+    def run(self, x):
+        if self._graphs is not None:
+            return self.run_graph(x)
+        if not self.use_io_binding:
+            return self.session.run(None, {self.inputs.name: x})
+
+        io_binding = getattr(self._scratch, 'io_binding', None)
+        if io_binding is None:
+            io_binding = self._scratch.io_binding = self.session.io_binding()
+            self._scratch.device_inputs = OrderedDict()
+        device_inputs = self._scratch.device_inputs
+
+        device_input = device_inputs.get(x.shape)
+        if device_input is None:
+            device_input = OrtValue.ortvalue_from_shape_and_type(x.shape, numpy.float32, 'cuda', 0)
+            device_inputs[x.shape] = device_input
+            if len(device_inputs) > self.max_device_inputs:
+                device_inputs.popitem(last=False)
+        else:
+            device_inputs.move_to_end(x.shape)
+        device_input.update_inplace(x)
+        io_binding.bind_ortvalue_input(self.inputs.name, device_input)
+        io_binding.bind_output(self.outputs.name, 'cpu')
+        self.session.run_with_iobinding(io_binding)
+        return io_binding.copy_outputs_to_cpu()
+
+    def run_graph(self, x):
+        graph = self._graphs.get(x.shape)
+        if graph is None:
+            # first batch of this shape runs uncaptured to learn the output shape
+            probe_options = RunOptions()
+            probe_options.add_run_config_entry('gpu_graph_id', '-1')
+            outputs = self.session.run(None, {self.inputs.name: x}, probe_options)
+
+            device_input = OrtValue.ortvalue_from_shape_and_type(x.shape, numpy.float32, 'cuda', 0)
+            device_output = OrtValue.ortvalue_from_shape_and_type(outputs[0].shape, outputs[0].dtype, 'cuda', 0)
+            io_binding = self.session.io_binding()
+            io_binding.bind_ortvalue_input(self.inputs.name, device_input)
+            io_binding.bind_ortvalue_output(self.outputs.name, device_output)
+            run_options = RunOptions()
+            run_options.add_run_config_entry('gpu_graph_id', str(len(self._graphs) + 1))
+            self._graphs[x.shape] = (device_input, device_output, io_binding, run_options)
+            return outputs
+
+        device_input, device_output, io_binding, run_options = graph
+        device_input.update_inplace(x)
+        self.session.run_with_iobinding(io_binding, run_options)
+        return [device_output.numpy()]
+
+    def batch_buffer(self, shape):
+        """Zeroed, contiguous view of this thread's reusable batch buffer"""
+        size = math.prod(shape)
+        batch_buf = getattr(self._scratch, 'batch_buf', None)
+        if batch_buf is None or size > batch_buf.size:
+            size_hint = self.batch_size * 3 * self.input_shape[1] * self.input_shape[2]
+            batch_buf = self._scratch.batch_buf = numpy.empty(max(size, size_hint), dtype=numpy.float32)
+        buf = batch_buf[:size].reshape(shape)
+        buf.fill(0)
+        return buf
+
+    def buckets(self, ratios, batch_size):
+        """Split sorted aspect ratios into batches of similar padded width"""
+        min_ratio = self.input_shape[2] / self.input_shape[1]
+        start = 0
+        for end in range(1, len(ratios) + 1):
+            if end == len(ratios) or end - start == batch_size or \
+                    max(ratios[end], min_ratio) > max(ratios[start], min_ratio) * self.bucket_ratio:
+                yield start, end
+                start = end
 
     def __call__(self, images):
-        batch_size = 6
+        batch_size = self.batch_size
         num_images = len(images)
 
-        results = [['', 0.0]] * num_images
-        confidences = [['', 0.0]] * num_images
-        indices = numpy.argsort(numpy.array([x.shape[1] / x.shape[0] for x in images]))
+        results = [None] * num_images
+        confidences = [None] * num_images
+        ratios = aspect_ratios(images)
+        indices = numpy.argsort(ratios)
+        ratios = ratios[indices]
 
-        for index in range(0, num_images, batch_size):
+        for index, end in self.buckets(ratios, batch_size):
             input_h, input_w = self.input_shape[1], self.input_shape[2]
-            max_wh_ratio = input_w / input_h
-            norm_images = []
-            for i in range(index, min(num_images, index + batch_size)):
-                h, w = images[indices[i]].shape[0:2]
-                max_wh_ratio = max(max_wh_ratio, w * 1.0 / h)
-            for i in range(index, min(num_images, index + batch_size)):
-                norm_image = self.resize(images[indices[i]], max_wh_ratio)
-                norm_image = norm_image[numpy.newaxis, :]
-                norm_images.append(norm_image)
-            norm_images = numpy.concatenate(norm_images)
-
-            outputs = self.session.run(None,
-                                       {self.inputs.name: norm_images})
-            result, confidence = self.ctc_decoder(outputs[0])
+            # ratios are sorted, so the widest crop of the batch is the last one
+            max_wh_ratio = max(input_w / input_h, ratios[end - 1])
+
+            bsz = end - index
+            padded_bsz, padded_w = bsz, self.input_width(max_wh_ratio)
+            if self._graphs is not None:
+                padded_bsz = batch_size
+                padded_w = -(-padded_w // self.graph_width_step) * self.graph_width_step
+            norm_images = self.batch_buffer((padded_bsz, self.input_shape[0], input_h, padded_w))
+            for i in range(bsz):
+                self.resize(images[indices[index + i]], max_wh_ratio, norm_images[i])
+
+            outputs = self.run(norm_images)
+            result, confidence = self.ctc_decoder(outputs[0][:bsz])
             for i in range(len(result)):
                 results[indices[index + i]] = result[i]
                 confidences[indices[index + i]] = confidence[i]
@@ -1,6 +1,81 @@
+import os
+
 import cv2
 import numpy
 
+CUDA_PROVIDER_OPTIONS = {'cudnn_conv_algo_search': 'EXHAUSTIVE',
+                         'arena_extend_strategy': 'kSameAsRequested',
+                         'do_copy_in_default_stream': True}
+
+
+def convert_model(onnx_path, precision='fp32'):
+    """Return the path of a reduced-precision copy of onnx_path, converting it on first use"""
+    if precision == 'fp32':
+        return onnx_path
+    root, ext = os.path.splitext(onnx_path)
+    target = f'{root}_{precision}{ext}'
+    if os.path.exists(target):
+        return target
+
+    if precision == 'int8':
+        import tempfile
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        # fold weight-feeding nodes into initializers; only the MatMul/Gemm weights are
+        # quantized, dynamic int8 convolutions wreck recognition accuracy
+        with tempfile.TemporaryDirectory() as tmp:
+            prepared = os.path.join(tmp, 'prepared.onnx')
+            quant_pre_process(onnx_path, prepared, skip_symbolic_shape=True)
+            quantize_dynamic(prepared, target, weight_type=QuantType.QInt8,
+                             op_types_to_quantize=['MatMul', 'Gemm'])
+    elif precision == 'fp16':
+        import onnx
+        from onnxconverter_common import float16
+        model = float16.convert_float_to_float16(onnx.load(onnx_path), keep_io_types=True)
+        onnx.save(model, target)
+    else:
+        raise ValueError(f"Unsupported precision: {precision}")
+    return target
+
+
+_env_allocator_registered = False
+
+
+def create_session_options(shared=False):
+    from onnxruntime import SessionOptions, GraphOptimizationLevel
+
+    options = SessionOptions()
+    options.graph_optimization_level = GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+    if shared:
+        # sessions built from these options share one CPU arena registered on the
+        # process-wide ORT environment, and idle thread pools do not spin
+        global _env_allocator_registered
+        if not _env_allocator_registered:
+            import onnxruntime
+            memory_info = onnxruntime.OrtMemoryInfo('Cpu', onnxruntime.OrtAllocatorType.ORT_ARENA_ALLOCATOR,
+                                                    0, onnxruntime.OrtMemType.DEFAULT)
+            onnxruntime.create_and_register_allocator(memory_info, None)
+            _env_allocator_registered = True
+        options.inter_op_num_threads = 1
+        options.add_session_config_entry('session.use_env_allocators', '1')
+        options.add_session_config_entry('session.intra_op.allow_spinning', '0')
+    return options
+
+
+def create_session(onnx_path, cuda_graph=False, options=None):
+    assert onnx_path is not None
+    assert os.path.exists(onnx_path)
+    from onnxruntime import InferenceSession
+
+    if options is None:
+        options = create_session_options()
+    cuda_options = dict(CUDA_PROVIDER_OPTIONS)
+    if cuda_graph:
+        cuda_options['enable_cuda_graph'] = '1'
+    providers = [('CUDAExecutionProvider', cuda_options), 'CPUExecutionProvider']
+    return InferenceSession(onnx_path, sess_options=options, providers=providers)
+
 
 def sort_polygon(points):
     points.sort(key=lambda x: (x[0][1], x[0][0]))
@@ -35,6 +110,51 @@ def crop_image(image, points):
     return image
 
 
+def aspect_ratios(images):
+    """Width / height of every image, gathered without building Python floats"""
+    shapes = numpy.fromiter((d for x in images for d in x.shape[:2]),
+                            dtype=numpy.int64, count=2 * len(images)).reshape(-1, 2)
+    return shapes[:, 1] / shapes[:, 0]
+
+
+def crop_sizes(points):
+    """(widths, heights) of the crops crop_images cuts from the boxes, before any rotation"""
+    points = numpy.asarray(points, dtype=numpy.float32).reshape(-1, 4, 2)
+    lengths = numpy.linalg.norm(points - numpy.roll(points, -1, axis=1), axis=2)
+    widths = numpy.maximum(lengths[:, 0], lengths[:, 2]).astype(int)
+    heights = numpy.maximum(lengths[:, 3], lengths[:, 1]).astype(int)
+    return widths, heights
+
+
+def crop_images(image, points):
+    """crop_image over all boxes, warping every crop into one shared buffer"""
+    points = numpy.asarray(points, dtype=numpy.float32)
+    if len(points) == 0:
+        return []
+    widths, heights = crop_sizes(points)
+
+    channels = image.shape[2] if image.ndim == 3 else 1
+    sizes = widths * heights * channels
+    offsets = numpy.concatenate(([0], numpy.cumsum(sizes)))
+    buffer = numpy.empty(offsets[-1], dtype=image.dtype)
+
+    crops = []
+    for i, (crop_width, crop_height) in enumerate(zip(widths.tolist(), heights.tolist())):
+        pts_std = numpy.float32([[0, 0],
+                                 [crop_width, 0],
+                                 [crop_width, crop_height],
+                                 [0, crop_height]])
+        matrix = cv2.getPerspectiveTransform(points[i], pts_std)
+        crop = buffer[offsets[i]:offsets[i + 1]].reshape((crop_height, crop_width) + image.shape[2:])
+        cv2.warpPerspective(image,
+                            matrix, (crop_width, crop_height), dst=crop,
+                            borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+        if crop_height * 1.0 / crop_width >= 1.5:
+            crop = numpy.rot90(crop, k=3)
+        crops.append(crop)
+    return crops
+
+
 class CTCDecoder(object):
     def __init__(self):
 
@@ -44,6 +164,7 @@ class CTCDecoder(object):
                           '`', 'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o', 'p',
                           'q', 'r', 's', 't', 'u', 'v', 'w', 'x', 'y', 'z', '{', '|', '}', '~', '!', '"', '#',
                           '$', '%', '&', "'", '(', ')', '*', '+', ',', '-', '.', '/', ' ', ' ']
+        self.table = numpy.array(self.character)
 
     def __call__(self, outputs):
         if isinstance(outputs, tuple) or isinstance(outputs, list):
@@ -52,19 +173,15 @@ class CTCDecoder(object):
         return self.decode(indices, outputs)
 
     def decode(self, indices, outputs):
+        # collapse repeats and drop ctc blanks (index 0) for the whole batch at once
+        selection = numpy.ones(indices.shape, dtype=bool)
+        selection[:, 1:] = indices[:, 1:] != indices[:, :-1]
+        selection &= indices != 0
+        scores = numpy.take_along_axis(outputs, indices[:, :, None], axis=2)[:, :, 0]
+
         results = []
         confidences = []
-        ignored_tokens = [0]  # for ctc blank
         for i in range(len(indices)):
-            selection = numpy.ones(len(indices[i]), dtype=bool)
-            selection[1:] = indices[i][1:] != indices[i][:-1]
-            for ignored_token in ignored_tokens:
-                selection &= indices[i] != ignored_token
-            result = []
-            confidence = []
-            for j in range(len(indices[i][selection])):
-                result.append(self.character[indices[i][selection][j]])
-                confidence.append(outputs[i][selection][j][indices[i][selection][j]])
-            results.append(''.join(result))
-            confidences.append(confidence)
+            results.append(''.join(self.table[indices[i][selection[i]]].tolist()))
+            confidences.append(list(scores[i][selection[i]]))
         return results, confidences
@@ -1,13 +1,78 @@
 import os
+import copy
+import hashlib
+import io
+import logging
 import cv2
 import numpy as np
 import re
+import string
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict, Any, Union
 from dataclasses import is_dataclass
+from PIL import Image
 from service.yolo.YOLODetector import YOLODetector, Detection
 from service.ocr.PaddletOCRApi import PaddleOCRProcessor
+from service.utils.ImageUploadHandler import jpeg_draft_factor
 from config import PtConfig
 
+logger = logging.getLogger(__name__)
+
+# cv2.imdecode flag for each jpeg_draft_factor result
+_REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Precompiled patterns for MRZ line splitting / cleanup
+_MRZ_SPLIT = re.compile(r'[\n\r]|(?=[A-Z]{2}[A-Z0-9<]{20,})')
+_MRZ_LINE = re.compile(r'[A-Z0-9<]{20,}')
+_MRZ_PATTERNS = re.compile(r'[A-Z0-9<]{20,}|[A-Z]+<<[A-Z<]*')
+_INVALID_MRZ = re.compile(r'[^A-Z0-9<]')
+# str.translate table deleting every ASCII char that is not a valid MRZ char
+_MRZ_KEEP = frozenset(string.ascii_uppercase + string.digits + '<')
+_MRZ_TRANS = str.maketrans('', '', ''.join(chr(c) for c in range(128) if chr(c) not in _MRZ_KEEP))
+# Same split over many texts joined by _TEXT_SEP; the separator is captured so texts can be told apart
+_TEXT_SEP = '\x1f'
+# Start of an MRZ run, i.e. where _MRZ_SPLIT's lookahead would split
+_MRZ_RUN = re.compile(r'[A-Z]{2}[A-Z0-9<]{20}')
+_MRZ_SPLIT_TEXTS = re.compile(r'(\x1f)|[\n\r]|(?=[A-Z]{2}[A-Z0-9<]{20,})')
+
+# All date formats in one pass; the outer named group tells which format matched
+_DATE_ANY = re.compile(
+    r'(?P<slash4>(\d{1,2})/(\d{1,2})/(\d{4}))'  # dd/mm/yyyy
+    r'|(?P<slash2>(\d{1,2})/(\d{1,2})/(\d{2})(?!\d))'  # dd/mm/yy
+    r'|(?P<ddmmyyyy>(?<!\d)(\d{2})(\d{2})(\d{4})(?!\d))'  # ddmmyyyy
+    r'|(?P<dash>(\d{1,2})-(\d{1,2})-(\d{4}))'  # dd-mm-yyyy
+    r'|(?P<ddmmyy>(?<!\d)(\d{2})(\d{2})(\d{2})(?!\d))'  # ddmmyy
+)
+_DATE_LABELS = {
+    'slash4': 'dd/mm/yyyy',
+    'slash2': 'dd/mm/yy',
+    'ddmmyyyy': 'ddmmyyyy',
+    'dash': 'dd-mm-yyyy',
+    'ddmmyy': 'ddmmyy',
+}
+_DIGITS_6 = re.compile(r'\d{6}')
+# Longest day of each month (February allows leap years)
+_MONTH_DAYS = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _is_valid_day_month(day: int, month: int) -> bool:
+    """Check day/month against the month's length."""
+    return 1 <= month <= 12 and 1 <= day <= _MONTH_DAYS[month - 1]
+
+# Shared worker for overlapping full-image OCR with YOLO detection
+_PIPELINE_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mrz-ocr")
+
+# Process-wide extractor shared by the API handlers
+_default_instance = None
+_default_instance_lock = threading.Lock()
+
 
 class MRZExtractor:
     """
@@ -15,21 +80,61 @@ class MRZExtractor:
     Uses YOLO for MRZ region detection and PaddleOCR for text recognition.
     """
     
-    def __init__(self, model_name: str = "MRZ.pt"):
+    def __init__(self, model_name: str = "MRZ.pt", min_confidence: float = 0.0,
+                 crop_ocr_coverage: float = 0.0, crop_padding: int = 10):
         """
         Initialize MRZ extractor with model path.
         
         Args:
             model_name: Name of the YOLO model file (default: "MRZ.pt")
+            min_confidence: MRZ detections below this confidence are ignored
+            crop_ocr_coverage: When the MRZ regions cover less than this fraction
+                of the image, OCR only their union instead of the full image.
+                Dates are then only searched inside that area (default: 0.0, disabled)
+            crop_padding: Pixels added around the MRZ union when cropping for OCR
         """
+        self.min_confidence = min_confidence
+        self.crop_ocr_coverage = crop_ocr_coverage
+        self.crop_padding = crop_padding
+        # Decode huge JPEG uploads at reduced DCT scale (same policy as ImageUploadHandler)
+        self.reduced_decode = True
         self.pt_config = PtConfig()
 
         self.model_path = self.pt_config.get_model("MRZ")
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"MRZ model not found at {self.model_path}")
 
-        self.detector = YOLODetector(self.model_path)
+        # Shared per model; the detector serialises its own predict calls
+        self.detector = YOLODetector.get_shared(self.model_path)
         self.ocr = PaddleOCRProcessor()
+        # LRU of extract_mrz_from_bytes results keyed by a hash of the input bytes
+        self.result_cache_size = 128
+        self._result_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+        self._result_cache_lock = threading.Lock()
+    
+    @staticmethod
+    def _empty_result(status: str, message: str, total_mrz_regions: int = 0) -> Dict[str, Any]:
+        """Result dict for the paths that produce no MRZ text."""
+        return {
+            "status": status,
+            "message": message,
+            "texts": [],
+            "mrz_string": "",
+            "mrz_length": 0,
+            "total_mrz_regions": total_mrz_regions,
+            "dates_found": [],
+            "total_dates": 0
+        }
+    
+    @classmethod
+    def get_default(cls) -> "MRZExtractor":
+        """Return the shared extractor, loading the models on first use."""
+        global _default_instance
+        if _default_instance is None:
+            with _default_instance_lock:
+                if _default_instance is None:
+                    _default_instance = cls()
+        return _default_instance
     
     def extract_mrz_from_image(self, image: np.ndarray) -> Dict[str, Any]:
         """
@@ -49,88 +154,180 @@ class MRZExtractor:
         """
         try:
 
+            # Full-image OCR does not depend on YOLO output, so run it alongside detection
+            # (unless it may be narrowed to the MRZ area, which needs the detections first)
+            ocr_future = None
+            if self.crop_ocr_coverage <= 0:
+                ocr_future = _PIPELINE_EXECUTOR.submit(self.ocr.process_full_image, image)
+            
             # Detect MRZ regions using YOLO
-            yolo_result = self.detector.detect(image)
+            try:
+                yolo_result = self.detector.detect(image)
+            except Exception:
+                if ocr_future is not None:
+                    ocr_future.cancel()
+                raise
             if isinstance(yolo_result, dict) and 'detections' in yolo_result:
                 detections = yolo_result['detections']
             elif isinstance(yolo_result, list):
                 detections = yolo_result
             else:
                 detections = []
+            detections = self._filter_detections(detections)
 
             if not detections:
-                return {
-                    "status": "no_mrz_detected",
-                    "message": "No MRZ regions detected in the image.",
-                    "texts": [],
-                    "mrz_string": "",
-                    "mrz_length": 0,
-                    "total_mrz_regions": 0,
-                    "dates_found": [],
-                    "total_dates": 0
-                }
-            
-            # Process full image with OCR
-            print("Processing full image with OCR...")
-            ocr_result = self.ocr.process_full_image(image)
-            
-            if not ocr_result or not isinstance(ocr_result, dict):
-                return {
-                    "status": "ocr_failed",
-                    "message": "OCR processing failed.",
-                    "texts": [],
-                    "mrz_string": "",
-                    "mrz_length": 0,
-                    "total_mrz_regions": len(detections),
-                    "dates_found": [],
-                    "total_dates": 0
-                }
-            
-            # Extract OCR results - PaddleOCR returns 'bboxes' not 'text_regions'
-            text_regions = ocr_result.get('bboxes', ocr_result.get('text_regions', []))
-            recognized_texts = ocr_result.get('texts', [])
-            print(f"OCR found {len(text_regions)} text regions with {len(recognized_texts)} recognized texts")
-            
-            # Handle PaddleOCR result structure
-            actual_texts = self._extract_texts_from_ocr_result(recognized_texts)
-            
-            # Create OCR detections for processing
-            ocr_detections = self._create_ocr_detections(text_regions, actual_texts)
-            print(f"Created {len(ocr_detections)} valid OCR detections")
-            
-            # Find texts within MRZ regions
-            all_mrz_texts = self._find_texts_in_mrz_regions(detections, ocr_detections)
+                if ocr_future is not None:
+                    ocr_future.cancel()
+                return self._empty_result("no_mrz_detected", "No MRZ regions detected in the image.")
+            
+            crop_box = self._mrz_crop_box(image, detections)
+            if crop_box is not None:
+                logger.debug("Processing MRZ area %s with OCR...", crop_box)
+                ocr_result = self._process_crop(image, crop_box)
+            elif ocr_future is not None:
+                # Wait for the full-image OCR pass
+                logger.debug("Processing full image with OCR...")
+                ocr_result = ocr_future.result()
+            else:
+                logger.debug("Processing full image with OCR...")
+                ocr_result = self.ocr.process_full_image(image)
             
-            # Generate final MRZ string
-            mrz_string = self._generate_mrz_string(all_mrz_texts)
+            return self._build_result(detections, ocr_result)
             
-            # Extract dates from ALL OCR texts (not just MRZ region texts)
-            all_ocr_texts = [det.get('text', '') for det in ocr_detections if det.get('text')]
-            dates_found = self.extract_dates_from_all_texts(all_ocr_texts)
+        except Exception as e:
+            return self._empty_result("error", f"Error processing image: {str(e)}")
+    
+    def extract_mrz_batch(self, images: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """
+        Extract MRZ text from several images with one batched YOLO forward
+        and one batched OCR recognition pass.
+        
+        Args:
+            images: Input images as numpy arrays (BGR format)
             
-            return {
-                "status": "success",
-                "message": f"Found {len(all_mrz_texts)} MRZ text lines",
-                "texts": all_mrz_texts,
-                "mrz_string": mrz_string,
-                "mrz_length": len(mrz_string),
-                "total_mrz_regions": len(detections),
-                "dates_found": dates_found,
-                "total_dates": len(dates_found),
-                "all_ocr_texts": all_ocr_texts  # For debugging
+        Returns:
+            List of result dictionaries, one per image (same layout as extract_mrz_from_image)
+        """
+        try:
+            all_detections = self.detector.detect_batch(images)
+            
+            all_detections = [self._filter_detections(detections) for detections in all_detections]
+            
+            # Only images with MRZ regions need the OCR pass, possibly narrowed to the MRZ area
+            pending = [i for i, detections in enumerate(all_detections) if detections]
+            crop_boxes = [self._mrz_crop_box(images[i], all_detections[i]) for i in pending]
+            ocr_inputs = [
+                images[i] if crop_box is None else images[i][crop_box[1]:crop_box[3], crop_box[0]:crop_box[2]]
+                for i, crop_box in zip(pending, crop_boxes)
+            ]
+            ocr_results = self.ocr.process_full_image_batch(ocr_inputs) if pending else []
+            ocr_by_index = {
+                i: ocr_result if crop_box is None else self._shift_ocr_bboxes(ocr_result, crop_box)
+                for i, crop_box, ocr_result in zip(pending, crop_boxes, ocr_results)
             }
             
+            results = []
+            for i, detections in enumerate(all_detections):
+                if not detections:
+                    results.append(self._empty_result("no_mrz_detected", "No MRZ regions detected in the image."))
+                    continue
+                try:
+                    results.append(self._build_result(detections, ocr_by_index[i]))
+                except Exception as e:
+                    results.append(self._empty_result("error", f"Error processing image: {str(e)}"))
+            return results
+            
         except Exception as e:
-            return {
-                "status": "error",
-                "message": f"Error processing image: {str(e)}",
-                "texts": [],
-                "mrz_string": "",
-                "mrz_length": 0,
-                "total_mrz_regions": 0,
-                "dates_found": [],
-                "total_dates": 0
-            }
+            return [self._empty_result("error", f"Error processing image batch: {str(e)}") for _ in images]
+    
+    def _filter_detections(self, detections: List) -> List:
+        """Drop MRZ detections below min_confidence."""
+        if self.min_confidence <= 0:
+            return detections
+        return [
+            detection for detection in detections
+            if (detection.get('confidence', 0) if isinstance(detection, dict)
+                else getattr(detection, 'confidence', 0)) >= self.min_confidence
+        ]
+    
+    def _mrz_crop_box(self, image: np.ndarray, detections: List) -> Optional[tuple]:
+        """
+        Padded union of the MRZ boxes as (x1, y1, x2, y2), or None when OCR
+        should run on the full image.
+        """
+        if self.crop_ocr_coverage <= 0:
+            return None
+        
+        boxes = []
+        for detection in detections:
+            bbox = detection.get('bbox', detection.get('box', [])) if isinstance(detection, dict) else detection.bbox
+            if len(bbox) >= 4:
+                boxes.append(bbox[:4])
+        if not boxes:
+            return None
+        
+        boxes = np.asarray(boxes, dtype=np.float64)
+        x1, y1 = boxes[:, :2].min(axis=0)
+        x2, y2 = boxes[:, 2:].max(axis=0)
+        image_h, image_w = image.shape[:2]
+        if (x2 - x1) * (y2 - y1) >= self.crop_ocr_coverage * image_w * image_h:
+            return None
+        
+        padding = self.crop_padding
+        return (max(0, int(x1) - padding), max(0, int(y1) - padding),
+                min(image_w, int(x2) + padding), min(image_h, int(y2) + padding))
+    
+    def _process_crop(self, image: np.ndarray, crop_box: tuple) -> Dict:
+        """Run OCR on a crop and shift its bboxes back to full-image coordinates."""
+        x1, y1, x2, y2 = crop_box
+        return self._shift_ocr_bboxes(self.ocr.process_full_image(image[y1:y2, x1:x2]), crop_box)
+    
+    @staticmethod
+    def _shift_ocr_bboxes(ocr_result, crop_box: tuple):
+        """Move OCR bboxes found in a crop back to full-image coordinates."""
+        if isinstance(ocr_result, dict) and ocr_result.get('bboxes') is not None:
+            offset = (crop_box[0], crop_box[1])
+            ocr_result['bboxes'] = [np.asarray(bbox) + offset for bbox in ocr_result['bboxes']]
+        return ocr_result
+    
+    def _build_result(self, detections: List, ocr_result) -> Dict[str, Any]:
+        """Fuse YOLO MRZ detections with a full-image OCR result into the response dict."""
+        if not ocr_result or not isinstance(ocr_result, dict):
+            return self._empty_result("ocr_failed", "OCR processing failed.", len(detections))
+        
+        # Extract OCR results - PaddleOCR returns 'bboxes' not 'text_regions'
+        text_regions = ocr_result.get('bboxes', ocr_result.get('text_regions', []))
+        recognized_texts = ocr_result.get('texts', [])
+        logger.debug("OCR found %d text regions with %d recognized texts", len(text_regions), len(recognized_texts))
+        
+        # Handle PaddleOCR result structure
+        actual_texts = self._extract_texts_from_ocr_result(recognized_texts)
+        
+        # Create OCR detections for processing
+        ocr_detections = self._create_ocr_detections(text_regions, actual_texts)
+        logger.debug("Created %d valid OCR detections", len(ocr_detections))
+        
+        # Find texts within MRZ regions
+        all_mrz_texts = self._find_texts_in_mrz_regions(detections, ocr_detections)
+        
+        # Generate final MRZ string
+        mrz_string = self._generate_mrz_string(all_mrz_texts)
+        
+        # Extract dates from ALL OCR texts (not just MRZ region texts)
+        all_ocr_texts = [det.get('text', '') for det in ocr_detections if det.get('text')]
+        dates_found = self.extract_dates_from_all_texts(all_ocr_texts)
+        
+        return {
+            "status": "success",
+            "message": f"Found {len(all_mrz_texts)} MRZ text lines",
+            "texts": all_mrz_texts,
+            "mrz_string": mrz_string,
+            "mrz_length": len(mrz_string),
+            "total_mrz_regions": len(detections),
+            "dates_found": dates_found,
+            "total_dates": len(dates_found),
+            "all_ocr_texts": all_ocr_texts  # For debugging
+        }
     
     def extract_mrz_from_file_path(self, image_path: str) -> Dict[str, Any]:
         """
@@ -145,30 +342,12 @@ class MRZExtractor:
         try:
             image = cv2.imread(image_path)
             if image is None:
-                return {
-                    "status": "error",
-                    "message": "Could not load image from path",
-                    "texts": [],
-                    "mrz_string": "",
-                    "mrz_length": 0,
-                    "total_mrz_regions": 0,
-                    "dates_found": [],
-                    "total_dates": 0
-                }
+                return self._empty_result("error", "Could not load image from path")
             
             return self.extract_mrz_from_image(image)
             
         except Exception as e:
-            return {
-                "status": "error",
-                "message": f"Error loading image: {str(e)}",
-                "texts": [],
-                "mrz_string": "",
-                "mrz_length": 0,
-                "total_mrz_regions": 0,
-                "dates_found": [],
-                "total_dates": 0
-            }
+            return self._empty_result("error", f"Error loading image: {str(e)}")
     
     def extract_mrz_from_bytes(self, image_bytes: bytes) -> Dict[str, Any]:
         """
@@ -181,35 +360,45 @@ class MRZExtractor:
             Dictionary with extraction results
         """
         try:
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            # Identical uploads (client retries, re-scans) reuse the previous result
+            cache_key = hashlib.blake2b(image_bytes, digest_size=16).digest()
+            with self._result_cache_lock:
+                cached = self._result_cache.get(cache_key)
+                if cached is not None:
+                    self._result_cache.move_to_end(cache_key)
+                    return copy.deepcopy(cached)
+            
+            image = self._decode_image(image_bytes)
             
             if image is None:
-                return {
-                    "status": "error",
-                    "message": "Invalid image data or corrupted bytes",
-                    "texts": [],
-                    "mrz_string": "",
-                    "mrz_length": 0,
-                    "total_mrz_regions": 0,
-                    "dates_found": [],
-                    "total_dates": 0
-                }
+                return self._empty_result("error", "Invalid image data or corrupted bytes")
             
-            return self.extract_mrz_from_image(image)
+            result = self.extract_mrz_from_image(image)
+            if result.get("status") != "error":
+                with self._result_cache_lock:
+                    self._result_cache[cache_key] = copy.deepcopy(result)
+                    if len(self._result_cache) > self.result_cache_size:
+                        self._result_cache.popitem(last=False)
+            return result
             
         except Exception as e:
-            return {
-                "status": "error",
-                "message": f"Error processing image bytes: {str(e)}",
-                "texts": [],
-                "mrz_string": "",
-                "mrz_length": 0,
-                "total_mrz_regions": 0,
-                "dates_found": [],
-                "total_dates": 0
-            }
+            return self._empty_result("error", f"Error processing image bytes: {str(e)}")
+    
+    def _decode_image(self, image_bytes: bytes) -> Optional[np.ndarray]:
+        """
+        Decode image bytes to BGR. JPEGs at least twice JPEG_DRAFT_SIZE on both sides are
+        decoded at a reduced libjpeg DCT scale that keeps them at or above JPEG_DRAFT_SIZE,
+        so MRZ crops cut from the frame keep enough resolution for recognition.
+        """
+        flags = cv2.IMREAD_COLOR
+        if self.reduced_decode and image_bytes[:2] == b'\xff\xd8':
+            try:
+                # Only the JPEG header is parsed here
+                with Image.open(io.BytesIO(image_bytes)) as header:
+                    flags = _REDUCED_DECODE_FLAGS[jpeg_draft_factor(header.size)]
+            except Exception:
+                pass
+        return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flags)
     
     def _extract_texts_from_ocr_result(self, recognized_texts) -> List[str]:
         """Extract actual text list from OCR result structure."""
@@ -220,13 +409,13 @@ class MRZExtractor:
             text_list, confidence_list = recognized_texts
             if isinstance(text_list, list):
                 actual_texts = text_list
-            print(f"Extracted {len(actual_texts)} texts from tuple structure")
+            logger.debug("Extracted %d texts from tuple structure", len(actual_texts))
         elif isinstance(recognized_texts, list):
             # Case: direct list of texts
             actual_texts = recognized_texts
-            print(f"Using direct list of {len(actual_texts)} texts")
+            logger.debug("Using direct list of %d texts", len(actual_texts))
         else:
-            print(f"Unexpected text structure: {type(recognized_texts)}")
+            logger.warning("Unexpected text structure: %s", type(recognized_texts))
             actual_texts = []
         
         return actual_texts
@@ -235,8 +424,10 @@ class MRZExtractor:
         """Create structured OCR detections from regions and texts."""
         ocr_detections = []
         min_length = min(len(text_regions), len(actual_texts))
-        print(f"Processing {min_length} matched text regions/texts pairs")
+        logger.debug("Processing %d matched text regions/texts pairs", min_length)
         
+        # Collect the usable (index, bbox, text) pairs first so the MRZ line split runs once
+        entries = []
         for i in range(min_length):
             try:
                 bbox = text_regions[i]
@@ -259,33 +450,98 @@ class MRZExtractor:
                         text_content = str(text_item)
                     
                     if text_content.strip():
-                        # Process text for MRZ patterns
-                        text_lines = self._process_text_for_mrz_patterns(text_content)
-                        
-                        # Add detections
-                        if len(text_lines) > 1:
-                            for j, line in enumerate(text_lines):
-                                if line.strip():
-                                    ocr_detections.append({
-                                        'bbox': bbox,
-                                        'text': line.strip(),
-                                        'confidence': 1.0
-                                    })
-                                    print(f"OCR Detection {i}.{j}: '{line.strip()[:100]}...' at {bbox}")
-                        else:
+                        entries.append((i, bbox, text_content))
+            except Exception as e:
+                logger.warning("Error processing OCR detection %d: %s - text_item type: %s, bbox type: %s", i, e, type(actual_texts[i]), type(text_regions[i]))
+                continue
+        
+        debug = logger.isEnabledFor(logging.DEBUG)
+        region_xyxy = self._regions_to_xyxy(text_regions)
+        # Most texts (names, labels, dates) can never split into several MRZ lines; skip the regex work for them
+        may_split = [self._may_split_into_mrz_lines(text_content) for _, _, text_content in entries]
+        raw_lines_per_text = iter(self._split_texts_for_mrz_patterns(
+            [text_content for (_, _, text_content), split in zip(entries, may_split) if split]
+        ))
+        
+        for (i, bbox, text_content), split in zip(entries, may_split):
+            try:
+                # Process text for MRZ patterns
+                if split:
+                    text_lines = self._process_text_for_mrz_patterns(text_content, next(raw_lines_per_text))
+                else:
+                    text_lines = [text_content]
+                # Normalize the box once; every split line shares it
+                xyxy = region_xyxy[i] if region_xyxy is not None else self._bbox_to_xyxy(bbox)
+                
+                # Add detections
+                if len(text_lines) > 1:
+                    for j, line in enumerate(text_lines):
+                        if line.strip():
                             ocr_detections.append({
                                 'bbox': bbox,
-                                'text': text_content.strip(),
+                                'xyxy': xyxy,
+                                'text': line.strip(),
                                 'confidence': 1.0
                             })
-                            print(f"OCR Detection {i}: '{text_content.strip()[:100]}...' at {bbox}")
+                            if debug:
+                                logger.debug("OCR Detection %d.%d: '%s...' at %s", i, j, line.strip()[:100], bbox)
+                else:
+                    ocr_detections.append({
+                        'bbox': bbox,
+                        'xyxy': xyxy,
+                        'text': text_content.strip(),
+                        'confidence': 1.0
+                    })
+                    if debug:
+                        logger.debug("OCR Detection %d: '%s...' at %s", i, text_content.strip()[:100], bbox)
             except Exception as e:
-                print(f"Error processing OCR detection {i}: {str(e)} - text_item type: {type(actual_texts[i])}, bbox type: {type(text_regions[i])}")
+                logger.warning("Error processing OCR detection %d: %s - text_item type: %s, bbox type: %s", i, e, type(actual_texts[i]), type(text_regions[i]))
                 continue
         
         return ocr_detections
     
-    def _process_text_for_mrz_patterns(self, text_content: str) -> List[str]:
+    @staticmethod
+    def _regions_to_xyxy(text_regions: List) -> Optional[np.ndarray]:
+        """
+        Bulk-convert PaddleOCR's (T, 4, 2) polygons to (T, 4) [x1, y1, x2, y2].
+        Returns None when the regions are not uniform polygons.
+        """
+        if len(text_regions) == 0:
+            return None
+        try:
+            polys = np.asarray(text_regions, dtype=np.float64)
+        except (ValueError, TypeError):
+            return None
+        if polys.ndim != 3 or polys.shape[1:] != (4, 2):
+            return None
+        return np.concatenate([polys.min(axis=1), polys.max(axis=1)], axis=1)
+    
+    @staticmethod
+    def _may_split_into_mrz_lines(text_content: str) -> bool:
+        """
+        Cheap check whether _process_text_for_mrz_patterns could return more than one line:
+        a line break, an MRZ run starting after the first character, or a >100 char text.
+        """
+        return ('\n' in text_content or '\r' in text_content or len(text_content) > 100
+                or (len(text_content) > 22 and _MRZ_RUN.search(text_content, 1) is not None))
+    
+    @staticmethod
+    def _split_texts_for_mrz_patterns(texts: List[str]) -> List[List[str]]:
+        """Split every text on MRZ line boundaries with a single regex pass over the joined texts."""
+        if not texts:
+            return []
+        
+        # _TEXT_SEP never occurs in OCR output; the captured separator marks where each text ends
+        parts = _MRZ_SPLIT_TEXTS.split(_TEXT_SEP.join(texts))
+        raw_lines_per_text = [[]]
+        for k, part in enumerate(parts):
+            if k % 2 == 0:
+                raw_lines_per_text[-1].append(part)
+            elif part == _TEXT_SEP:
+                raw_lines_per_text.append([])
+        return raw_lines_per_text
+    
+    def _process_text_for_mrz_patterns(self, text_content: str, raw_lines: Optional[List[str]] = None) -> List[str]:
         """Process text content to extract MRZ patterns."""
         try:
             text_lines = []
@@ -293,29 +549,31 @@ class MRZExtractor:
             # Ensure text_content is a string
             text_content = str(text_content)
             
-            # Split by common separators
-            raw_lines = re.split(r'[\n\r]|(?=[A-Z]{2}[A-Z0-9<]{20,})', text_content)
+            # Split by common separators (unless the caller already did)
+            if raw_lines is None:
+                raw_lines = _MRZ_SPLIT.split(text_content)
             
             for line in raw_lines:
                 line = line.strip()
                 if line:
                     # Check if line looks like MRZ
-                    if re.match(r'[A-Z0-9<]{20,}', line) or '<<' in line:
+                    if _MRZ_LINE.match(line) or '<<' in line:
                         text_lines.append(line)
                     elif len(line) > 100:  # Long text might contain multiple MRZ lines
                         # Extract MRZ patterns from long text
-                        mrz_patterns = re.findall(r'[A-Z0-9<]{20,}|[A-Z]+<<[A-Z<]*', line)
+                        mrz_patterns = _MRZ_PATTERNS.findall(line)
                         text_lines.extend(mrz_patterns)
                     else:
                         text_lines.append(line)
             
             return text_lines if text_lines else [text_content]
         except Exception as e:
-            print(f"Error in _process_text_for_mrz_patterns: {str(e)}")
+            logger.warning("Error in _process_text_for_mrz_patterns: %s", e)
             return [str(text_content)]
     
-    def _bbox_overlap(self, text_bbox, mrz_bbox) -> bool:
-        """Check if text bbox overlaps with MRZ region bbox."""
+    @staticmethod
+    def _bbox_to_xyxy(text_bbox) -> Optional[np.ndarray]:
+        """Normalize an OCR bbox (4-point polygon, [x1, y1, x2, y2] or flattened) to [x1, y1, x2, y2]."""
         try:
             # Convert to numpy array if needed
             if isinstance(text_bbox, np.ndarray):
@@ -325,52 +583,82 @@ class MRZExtractor:
             
             # Check if it's a 4-point polygon format: [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
             if text_bbox_arr.shape == (4, 2):
-                text_x1, text_y1 = text_bbox_arr.min(axis=0)
-                text_x2, text_y2 = text_bbox_arr.max(axis=0)
+                return np.concatenate([text_bbox_arr.min(axis=0), text_bbox_arr.max(axis=0)]).astype(np.float64)
             # Check if it's already in [x1, y1, x2, y2] format
             elif text_bbox_arr.shape == (4,) or (text_bbox_arr.ndim == 1 and len(text_bbox_arr) == 4):
-                text_x1, text_y1, text_x2, text_y2 = text_bbox_arr[:4]
+                return text_bbox_arr[:4].astype(np.float64)
             else:
                 # Try to flatten and use first 4 values
                 flat = text_bbox_arr.flatten()
                 if len(flat) >= 8:
                     # Assume 4 points: [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
                     points = flat[:8].reshape(4, 2)
-                    text_x1, text_y1 = points.min(axis=0)
-                    text_x2, text_y2 = points.max(axis=0)
+                    return np.concatenate([points.min(axis=0), points.max(axis=0)]).astype(np.float64)
                 elif len(flat) >= 4:
-                    text_x1, text_y1, text_x2, text_y2 = flat[:4]
+                    return flat[:4].astype(np.float64)
                 else:
-                    return False
+                    return None
         except Exception as e:
-            print(f"    Error parsing text_bbox: {e}, shape: {text_bbox_arr.shape if isinstance(text_bbox, np.ndarray) else 'N/A'}")
-            return False
-        
-        # mrz_bbox from YOLO: [x1, y1, x2, y2]
+            logger.warning("Error parsing text_bbox: %s", e)
+            return None
+    
+    @staticmethod
+    def _overlap_ratios(text_xyxy: np.ndarray, mrz_bbox) -> np.ndarray:
+        """Fraction of each (N, 4) text box area covered by the MRZ region bbox (0 for empty boxes)."""
         mrz_x1, mrz_y1, mrz_x2, mrz_y2 = mrz_bbox
-        
-        # Calculate overlap
-        overlap_x = max(0, min(text_x2, mrz_x2) - max(text_x1, mrz_x1))
-        overlap_y = max(0, min(text_y2, mrz_y2) - max(text_y1, mrz_y1))
-        overlap_area = overlap_x * overlap_y
-        
-        # Calculate text area
-        text_area = (text_x2 - text_x1) * (text_y2 - text_y1)
-        
-        # Consider overlap if >= 50% of text area
-        if text_area > 0:
-            overlap_ratio = overlap_area / text_area
-            is_overlap = overlap_ratio >= 0.5
-            # Debug output for MRZ-like texts
-            if not is_overlap:
-                print(f"    No overlap: text[{int(text_x1)},{int(text_y1)},{int(text_x2)},{int(text_y2)}] vs mrz[{int(mrz_x1)},{int(mrz_y1)},{int(mrz_x2)},{int(mrz_y2)}] ratio={overlap_ratio:.2f}")
-            return is_overlap
-        return False
+        overlap_x = np.maximum(0, np.minimum(text_xyxy[:, 2], mrz_x2) - np.maximum(text_xyxy[:, 0], mrz_x1))
+        overlap_y = np.maximum(0, np.minimum(text_xyxy[:, 3], mrz_y2) - np.maximum(text_xyxy[:, 1], mrz_y1))
+        text_area = (text_xyxy[:, 2] - text_xyxy[:, 0]) * (text_xyxy[:, 3] - text_xyxy[:, 1])
+        ratios = np.zeros(len(text_xyxy))
+        np.divide(overlap_x * overlap_y, text_area, out=ratios, where=text_area > 0)
+        return ratios
     
     def _find_texts_in_mrz_regions(self, detections: List[Union[Detection, Dict]], ocr_detections: List[Dict]) -> List[str]:
         """Find all texts that fall within MRZ regions."""
         all_mrz_texts = []
         
+        # Normalize every usable OCR box once; each MRZ region is then a vectorized filter
+        ocr_candidates = []
+        ocr_xyxy = []
+        for ocr_detection in ocr_detections:
+            try:
+                text_bbox = ocr_detection.get('bbox', [])
+                text_content = ocr_detection.get('text', '')
+                text_confidence = ocr_detection.get('confidence', 1.0)
+                
+                # Ensure text_content is string and not empty
+                if isinstance(text_content, list):
+                    text_content = ' '.join(str(t) for t in text_content if t)
+                text_content = str(text_content).strip()
+                
+                # Check if text_bbox is valid (handle numpy arrays and lists)
+                bbox_valid = False
+                if isinstance(text_bbox, np.ndarray):
+                    bbox_valid = text_bbox.size > 0
+                elif isinstance(text_bbox, list):
+                    bbox_valid = len(text_bbox) > 0
+                else:
+                    bbox_valid = text_bbox is not None
+                
+                if not text_content or not bbox_valid:
+                    continue
+                
+                xyxy = ocr_detection.get('xyxy')
+                if xyxy is None:
+                    xyxy = self._bbox_to_xyxy(text_bbox)
+                if xyxy is None:
+                    continue
+                ocr_candidates.append({
+                    'text': text_content,
+                    'confidence': text_confidence,
+                    'bbox': text_bbox
+                })
+                ocr_xyxy.append(xyxy)
+            except Exception as text_error:
+                logger.warning("Error processing OCR text: %s", text_error)
+                continue
+        ocr_xyxy = np.array(ocr_xyxy, dtype=np.float64).reshape(-1, 4)
+        
         for i, detection in enumerate(detections):
             try:
                 # Extract bounding box coordinates from Detection object or dict
@@ -388,7 +676,7 @@ class MRZExtractor:
                     confidence = detection.confidence
                     class_name = getattr(detection, 'class_name', 'unknown')
                 else:
-                    print(f"⚠️ Unknown detection type: {type(detection)}")
+                    logger.warning("Unknown detection type: %s", type(detection))
                     continue
                 
                 # Validate mrz_bbox (handle numpy arrays)
@@ -402,77 +690,25 @@ class MRZExtractor:
                     bbox_len = len(mrz_bbox)
                 
                 if not bbox_valid:
-                    print(f"⚠️ Invalid bbox for detection {i}: length={bbox_len}")
+                    logger.warning("Invalid bbox for detection %d: length=%d", i, bbox_len)
                     continue
                 
                 x1, y1, x2, y2 = map(int, mrz_bbox[:4])
                 
-                print(f"MRZ Region {i+1} ({class_name}): bbox=[{x1},{y1},{x2},{y2}], confidence={confidence:.3f}")
+                logger.debug("MRZ Region %d (%s): bbox=[%d,%d,%d,%d], confidence=%.3f", i + 1, class_name, x1, y1, x2, y2, confidence)
                 
-                # Find all OCR texts within this MRZ region
-                region_texts = []
-                
-                for ocr_detection in ocr_detections:
-                    try:
-                        text_bbox = ocr_detection.get('bbox', [])
-                        text_content = ocr_detection.get('text', '')
-                        text_confidence = ocr_detection.get('confidence', 1.0)
-                        
-                        # Ensure text_content is string and not empty
-                        if isinstance(text_content, list):
-                            text_content = ' '.join(str(t) for t in text_content if t)
-                        text_content = str(text_content).strip()
-                        
-                        # Check if text_bbox is valid (handle numpy arrays and lists)
-                        bbox_valid = False
-                        if isinstance(text_bbox, np.ndarray):
-                            bbox_valid = text_bbox.size > 0
-                        elif isinstance(text_bbox, list):
-                            bbox_valid = len(text_bbox) > 0
-                        else:
-                            bbox_valid = text_bbox is not None
-                        
-                        if not text_content or not bbox_valid:
-                            continue
-                        
-                        # Check if text falls within MRZ region
-                        if self._bbox_overlap(text_bbox, mrz_bbox):
-                            region_texts.append({
-                                'text': text_content,
-                                'confidence': text_confidence,
-                                'bbox': text_bbox
-                            })
-                            print(f"  Found MRZ text: '{text_content}' (conf: {text_confidence:.3f})")
-                    
-                    except Exception as text_error:
-                        print(f"  Error processing OCR text: {str(text_error)}")
-                        continue
-                
-                # Sort by Y coordinate (top to bottom)
-                def get_y_coord(item):
-                    bbox = item['bbox']
-                    if isinstance(bbox, np.ndarray):
-                        bbox_arr = bbox
-                    else:
-                        bbox_arr = np.array(bbox)
-                    
-                    # Check shape to determine format
-                    if bbox_arr.shape == (4, 2):
-                        # Format: [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
-                        return bbox_arr.min(axis=0)[1]
-                    else:
-                        # Format: [x1, y1, x2, y2] or flattened
-                        flat = bbox_arr.flatten()
-                        return flat[1] if len(flat) >= 2 else 0
-                
-                region_texts.sort(key=get_y_coord)
-                
-                # Add to results
-                for text_item in region_texts:
-                    all_mrz_texts.append(text_item['text'])
+                # Find all OCR texts within this MRZ region (>= 50% of the text box inside it)
+                if len(ocr_xyxy):
+                    idx = np.flatnonzero(self._overlap_ratios(ocr_xyxy, mrz_bbox[:4]) >= 0.5)
+                    # Sort by Y coordinate (top to bottom); stable so ties keep OCR order
+                    idx = idx[np.argsort(ocr_xyxy[idx, 1], kind='stable')]
+                    for k in idx:
+                        text_item = ocr_candidates[k]
+                        logger.debug("Found MRZ text: '%s' (conf: %.3f)", text_item['text'], text_item['confidence'])
+                        all_mrz_texts.append(text_item['text'])
                     
             except Exception as e:
-                print(f"Error processing MRZ detection {i}: {str(e)}")
+                logger.warning("Error processing MRZ detection %d: %s", i, e)
                 continue
         
         return all_mrz_texts
@@ -483,10 +719,13 @@ class MRZExtractor:
         
         if all_mrz_texts:
             # Join all texts together, remove invalid characters and uppercase
-            combined_text = ''.join(all_mrz_texts)
-            # Keep only valid MRZ characters and uppercase
-            mrz_string = re.sub(r'[^A-Z0-9<]', '', combined_text.upper())
-            print(f"Generated MRZ string: {mrz_string}")
+            combined_text = ''.join(all_mrz_texts).upper()
+            # Keep only valid MRZ characters (translate table covers ASCII only)
+            if combined_text.isascii():
+                mrz_string = combined_text.translate(_MRZ_TRANS)
+            else:
+                mrz_string = _INVALID_MRZ.sub('', combined_text)
+            logger.debug("Generated MRZ string: %s", mrz_string)
         
         return mrz_string
     
@@ -501,108 +740,33 @@ class MRZExtractor:
         Returns:
             List of formatted date strings (dd/MM/yyyy)
         """
-        dates_found = []
+        dates_found = set()
         
         for text in texts:
             if not text:
                 continue
                 
             text_str = str(text).strip()
-            print(f"Searching for dates in: '{text_str}'")
-            
-            # Pattern 1: dd/mm/yyyy (like 18/03/2024) - relaxed word boundaries
-            pattern1 = r'(\d{1,2})/(\d{1,2})/(\d{4})'
-            matches1 = re.findall(pattern1, text_str)
-            for match in matches1:
-                day, month, year = match
-                try:
-                    day_int, month_int, year_int = int(day), int(month), int(year)
-                    if 1 <= day_int <= 31 and 1 <= month_int <= 12 and 1900 <= year_int <= 2100:
-                        formatted_date = f"{day_int:02d}/{month_int:02d}/{year_int}"
-                        if formatted_date not in dates_found:
-                            dates_found.append(formatted_date)
-                            print(f"Found date (dd/mm/yyyy): {formatted_date}")
-                except:
-                    pass
-            
-            # Pattern 2: dd/mm/yy (like 18/03/24) - relaxed word boundaries
-            pattern2 = r'(\d{1,2})/(\d{1,2})/(\d{2})(?!\d)'  # negative lookahead to avoid matching part of 4-digit year
-            matches2 = re.findall(pattern2, text_str)
-            for match in matches2:
-                day, month, year = match
-                try:
-                    day_int, month_int, year_int = int(day), int(month), int(year)
-                    # Handle 2-digit year
-                    if year_int >= 50:
-                        full_year = 1900 + year_int
-                    else:
-                        full_year = 2000 + year_int
-                    
-                    if 1 <= day_int <= 31 and 1 <= month_int <= 12:
-                        formatted_date = f"{day_int:02d}/{month_int:02d}/{full_year}"
-                        if formatted_date not in dates_found:
-                            dates_found.append(formatted_date)
-                            print(f"Found date (dd/mm/yy): {formatted_date}")
-                except:
-                    pass
-            
-            # Pattern 3: ddmmyyyy (like 18032024) - more restrictive
-            pattern3 = r'(?<!\d)(\d{2})(\d{2})(\d{4})(?!\d)'
-            matches3 = re.findall(pattern3, text_str)
-            for match in matches3:
-                day, month, year = match
-                try:
-                    day_int, month_int, year_int = int(day), int(month), int(year)
-                    if 1 <= day_int <= 31 and 1 <= month_int <= 12 and 1900 <= year_int <= 2100:
-                        formatted_date = f"{day_int:02d}/{month_int:02d}/{year_int}"
-                        if formatted_date not in dates_found:
-                            dates_found.append(formatted_date)
-                            print(f"Found date (ddmmyyyy): {formatted_date}")
-                except:
-                    pass
-            
-            # Pattern 4: dd-mm-yyyy (like 18-03-2024)
-            pattern4 = r'(\d{1,2})-(\d{1,2})-(\d{4})'
-            matches4 = re.findall(pattern4, text_str)
-            for match in matches4:
-                day, month, year = match
-                try:
-                    day_int, month_int, year_int = int(day), int(month), int(year)
-                    if 1 <= day_int <= 31 and 1 <= month_int <= 12 and 1900 <= year_int <= 2100:
-                        formatted_date = f"{day_int:02d}/{month_int:02d}/{year_int}"
-                        if formatted_date not in dates_found:
-                            dates_found.append(formatted_date)
-                            print(f"Found date (dd-mm-yyyy): {formatted_date}")
-                except:
-                    pass
+            logger.debug("Searching for dates in: '%s'", text_str)
             
-            # Pattern 5: ddmmyy (6 digits like 180324) - be careful not to match random 6-digit numbers
-            pattern5 = r'(?<!\d)(\d{6})(?!\d)'
-            matches5 = re.findall(pattern5, text_str)
-            for match in matches5:
-                date_str = match
-                # Try ddmmyy format
-                try:
-                    day = int(date_str[:2])
-                    month = int(date_str[2:4])
-                    year = int(date_str[4:6])
-                    
+            for match in _DATE_ANY.finditer(text_str):
+                day, month, year = [g for g in match.groups() if g is not None][1:]
+                day_int, month_int, year_int = int(day), int(month), int(year)
+                if len(year) == 2:
                     # Handle 2-digit year
-                    if year >= 50:
-                        full_year = 1900 + year
-                    else:
-                        full_year = 2000 + year
-                    
-                    if 1 <= day <= 31 and 1 <= month <= 12:
-                        formatted_date = f"{day:02d}/{month:02d}/{full_year}"
-                        if formatted_date not in dates_found:
-                            dates_found.append(formatted_date)
-                            print(f"Found date (ddmmyy): {formatted_date}")
-                except:
-                    pass
-        
-        print(f"Total dates found: {dates_found}")
-        return sorted(list(set(dates_found)))  # Remove duplicates and sort
+                    year_int += 1900 if year_int >= 50 else 2000
+                elif not 1900 <= year_int <= 2100:
+                    continue
+                
+                if _is_valid_day_month(day_int, month_int):
+                    formatted_date = f"{day_int:02d}/{month_int:02d}/{year_int}"
+                    if formatted_date not in dates_found:
+                        dates_found.add(formatted_date)
+                        logger.debug("Found date (%s): %s", _DATE_LABELS[match.lastgroup], formatted_date)
+        
+        dates_found = sorted(dates_found)
+        logger.debug("Total dates found: %s", dates_found)
+        return dates_found
     
     def extract_dates_from_texts(self, texts: List[str]) -> List[str]:
         """
@@ -614,7 +778,7 @@ class MRZExtractor:
         Returns:
             List of formatted date strings (dd/MM/yyyy)
         """
-        dates_found = []
+        dates_found = set()
         
         for text in texts:
             if not text:
@@ -623,56 +787,29 @@ class MRZExtractor:
             text_str = str(text).strip()
             
             # Look for 6-digit date patterns
-            date_patterns = re.findall(r'\d{6}', text_str)
+            date_patterns = _DIGITS_6.findall(text_str)
             
             for date_str in date_patterns:
                 # Try different date formats
-                formatted_dates = self._parse_date_patterns(date_str)
-                for date in formatted_dates:
-                    if date and date not in dates_found:
-                        dates_found.append(date)
+                dates_found.update(date for date in self._parse_date_patterns(date_str) if date)
         
-        return sorted(list(set(dates_found)))  # Remove duplicates and sort
+        return sorted(dates_found)
     
     def _parse_date_patterns(self, date_str: str) -> List[str]:
         """Parse date string in different formats."""
         dates = []
         
-        if len(date_str) == 6:
-            # Try YYMMDD format
-            try:
-                year = int(date_str[:2])
-                month = int(date_str[2:4])
-                day = int(date_str[4:6])
-                
-                # Handle 2-digit year
-                if year >= 50:
-                    full_year = 1900 + year
-                else:
-                    full_year = 2000 + year
-                
-                if 1 <= month <= 12 and 1 <= day <= 31:
-                    dates.append(f"{day:02d}/{month:02d}/{full_year}")
-            except:
-                pass
+        # isdecimal() guarantees int() succeeds, so no try/except is needed
+        if len(date_str) == 6 and date_str.isdecimal():
+            first, middle, last = int(date_str[:2]), int(date_str[2:4]), int(date_str[4:6])
             
-            # Try DDMMYY format
-            try:
-                day = int(date_str[:2])
-                month = int(date_str[2:4])
-                year = int(date_str[4:6])
-                
-                # Handle 2-digit year
-                if year >= 50:
-                    full_year = 1900 + year
-                else:
-                    full_year = 2000 + year
-                
-                if 1 <= month <= 12 and 1 <= day <= 31:
+            # Try YYMMDD format, then DDMMYY format
+            for day, month, year in ((last, middle, first), (first, middle, last)):
+                if _is_valid_day_month(day, month):
+                    # Handle 2-digit year
+                    full_year = year + (1900 if year >= 50 else 2000)
                     formatted_date = f"{day:02d}/{month:02d}/{full_year}"
                     if formatted_date not in dates:
                         dates.append(formatted_date)
-            except:
-                pass
         
         return dates
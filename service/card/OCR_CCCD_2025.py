@@ -2,6 +2,15 @@ from service.yolo.YOLODetector import YOLODetector, DetectionConfig
 from config import PtConfig
 from service.ocr.VietOCRApi import VietOCRProcessor
 import json
+import cv2
+import numpy as np
+
+# Labels không cần OCR (ảnh chân dung, góc thẻ, và các field bỏ qua)
+_NON_TEXT_LABELS = frozenset({
+    'portrait', 'top_right', 'bottom_right', 'bottom_left', 'top_left',
+    "Sex", "ID", "Name", "Date_of_birth", "Nationality",
+    'Date of expirty', 'Date of issue', "Place", "Place of birth"
+})
 
 class OCR_CCCD_2025:
     def __init__(self):
@@ -14,7 +23,14 @@ class OCR_CCCD_2025:
         )
         self.ptconfig = PtConfig()
         self.viet_ocr_processor = VietOCRProcessor()
-        self.model = YOLODetector(self.ptconfig.get_model("OCR_CCCD_2025"), self.config)
+        # Dùng chung weights với các service khác, warm-up YOLO chỉ chạy ở lần load đầu
+        self.model = YOLODetector.get_shared(self.ptconfig.get_model("OCR_CCCD_2025"), self.config)
+        
+        # Trả chi phí cold-start lúc khởi tạo thay vì ở request đầu tiên
+        try:
+            self.viet_ocr_processor.process_bbox(np.zeros((64, 256, 3), dtype=np.uint8), [0, 0, 256, 64])
+        except Exception as e:
+            print(f"⚠️ VietOCR warm-up failed: {e}")
     
     def process_image(self, image_path):
         """
@@ -26,16 +42,25 @@ class OCR_CCCD_2025:
         Returns:
             dict: Extracted citizen card data
         """
-        result = self.model.detect(image_path)
+        # Decode once; YOLO and every OCR crop share the same array
+        image = image_path if isinstance(image_path, np.ndarray) else cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"Could not load image: {image_path}")
+        
+        result = self.model.detect(image)
         citizens_card_data = {}
         
+        # Gom các field cần OCR rồi nhận dạng trong một lần batch
+        text_detections = []
         for detection in result:
-            print(detection)
-            class_name = detection.class_name
-            if class_name not in ['portrait', 'top_right', 'bottom_right', 'bottom_left', 'top_left',"Sex","ID","Name","Date_of_birth","Nationality",'Date of expirty','Date of issue',"Place","Place of birth"]:
-                citizens_card_data[class_name] = self.viet_ocr_processor.process_bbox(
-                    image_path, detection.bbox
-                ).get("text", "")
+            if detection.class_name not in _NON_TEXT_LABELS:
+                text_detections.append(detection)
+        
+        ocr_results = self.viet_ocr_processor.process_bboxes_batch(
+            image, [detection.bbox for detection in text_detections]
+        )
+        for detection, ocr_result in zip(text_detections, ocr_results):
+            citizens_card_data[detection.class_name] = ocr_result.get("text", "")
         
         return citizens_card_data
 
@@ -7,6 +7,10 @@ import json
 import numpy as np
 import cv2
 from PIL import Image
+
+# Kernel sharpen cho ảnh MRZ, tạo một lần thay vì mỗi detection
+SHARPEN_KERNEL = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]], dtype=np.float32)
+
 class OCR_CCCD_2025_NEW:
     def __init__(self,face=None):
         self.config = DetectionConfig(
@@ -28,8 +32,8 @@ class OCR_CCCD_2025_NEW:
         self.image_base_config = ImageBaseConfig()
         self.viet_ocr_processor = VietOCRProcessor()
         self.paddleocr = PaddleOCRProcessor(weights_dir=self.weights_config.getdir())
-        self.model = YOLODetector(self.ptconfig.get_model("OCR_CCCD_2025"), self.config)
-        self.mrz = YOLODetector(self.ptconfig.get_model("MRZ"), self.config_mrz)      
+        self.model = YOLODetector.get_shared(self.ptconfig.get_model("OCR_CCCD_2025"), self.config)
+        self.mrz = YOLODetector.get_shared(self.ptconfig.get_model("MRZ"), self.config_mrz)      
         self.image_front = self.image_base_config.get_image("base_cccd_new")
         #self.image_back = self.image_base_config.get_image("base_qr_cccd_back")
     
@@ -137,8 +141,7 @@ class OCR_CCCD_2025_NEW:
                                                            cv2.THRESH_BINARY, 11, 2)
                     
                     # 5. Apply sharpening
-                    kernel_sharpen = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-                    sharpened = cv2.filter2D(adaptive_thresh, -1, kernel_sharpen)
+                    sharpened = cv2.filter2D(adaptive_thresh, -1, SHARPEN_KERNEL)
                     
                     # 6. Convert back to BGR for OCR
                     mrz_final = cv2.cvtColor(sharpened, cv2.COLOR_GRAY2BGR)
@@ -191,14 +194,14 @@ class OCR_CCCD_2025_NEW:
         if missing_detections > 3:
             # Re-detect using ORB if missing more than 3 fields
             print(f"Missing {missing_detections} detections, re-detecting with ORB...")
-            from service.orb.ORBImageAligner import ORBImageAligner
+            from service.orb.ORBImageAligner import ORBImageAligner, MIN_ALIGNMENT_INLIERS, INLIER_SCORE_TIERS
             from PIL import Image
             import cv2
             
             aligner = ORBImageAligner(target_dimension=800, orb_features=5000)
             # Determine if image_path is front or back side and set appropriate template
             template_image = self.image_front
-            alignment_result = aligner.align(template_image, image_path)
+            alignment_result = aligner.align(template_image, image_path, visualize=False)
             aligned_image = alignment_result.get("aligned_image")
             
             # Kiểm tra chất lượng alignment
@@ -224,8 +227,8 @@ class OCR_CCCD_2025_NEW:
                 # Sử dụng scoring system linh hoạt thay vì hard threshold
                 
                 # 1. Kiểm tra ngưỡng tối thiểu tuyệt đối (MUST HAVE)
-                # Giảm ngưỡng vì algorithm mới có thể cho inliers thấp nhưng vẫn tốt
-                min_absolute_inliers = 25  # Tối thiểu 25 inliers
+                # Giảm ngưỡng vì algorithm mới có thể cho inliers thấp nhưng vẫn tốt (xem ORBImageAligner)
+                min_absolute_inliers = MIN_ALIGNMENT_INLIERS
                 min_absolute_matches = 50  # Tăng matches vì có nhiều features hơn
                 min_blur_score = 50  # Giữ nguyên blur score
                 
@@ -237,17 +240,8 @@ class OCR_CCCD_2025_NEW:
                     # 2. Đánh giá chất lượng bằng scoring system
                     score = 0
                     
-                    # Điểm cho inliers (0-40 điểm) - điều chỉnh tiers
-                    if inliers >= 100:
-                        score += 40
-                    elif inliers >= 60:
-                        score += 35
-                    elif inliers >= 40:
-                        score += 25
-                    elif inliers >= 25:
-                        score += 15
-                    else:
-                        score += 5
+                    # Điểm cho inliers (0-40 điểm) - tiers dùng chung trong ORBImageAligner
+                    score += next((points for min_inliers, points in INLIER_SCORE_TIERS if inliers >= min_inliers), 5)
                     
                     # Điểm cho good matches (0-30 điểm) - tăng ngưỡng do có nhiều features hơn
                     if good_matches >= 300:
@@ -1,8 +1,40 @@
 from service.yolo.YOLODetector import YOLODetector, DetectionConfig
 import os
+import re
 import json
+import logging
+import threading
+from collections import Counter
+from dataclasses import astuple
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from service.card.CardService import CardService, CardSideService
 
+try:
+    # anyascii transliterates with table lookups and is much faster than unidecode on long text
+    from anyascii import anyascii as _to_ascii
+except ImportError:
+    from unidecode import unidecode as _to_ascii
+
+try:
+    # torch is already resident via the YOLO detector; torchvision's NMS is a C++ kernel
+    import torch
+    from torchvision.ops import nms as _nms
+except ImportError:
+    _nms = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = frozenset((".jpg", ".jpeg", ".png", ".bmp"))
+
+# OCR song song (ONNX Runtime nhả GIL khi inference) dùng chung cho mọi CCCDDetector
+_OCR_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cccd-ocr")
+
+# CCCDDetector dùng chung theo (model_path, config, weights_dir) cho các API endpoint
+_shared_cccd_detectors = {}
+_shared_cccd_detectors_lock = threading.Lock()
+
 class CCCDDetector:
     # Mapping detected labels to card categories and types
     LABEL_TO_CARD_MAPPING = {
@@ -21,52 +53,74 @@ class CCCDDetector:
     }
     
     def __init__(self, model_path, config, weights_dir='weights'):
-        self.detector = YOLODetector(model_path, config)
+        # Shared per (model, config) and warmed up on first load, so per-request construction is cheap
+        self.detector = YOLODetector.get_shared(model_path, config)
         self.paddle_ocr_processor = None
+        self._ocr_init_lock = threading.Lock()
         self.weights_dir = weights_dir
         
+        # Card category/side lookups only depend on the fixed label mapping, resolve them once
+        self._label_card_info = {
+            label: (CardService.get_card_by_id(mapping['category_id']),
+                    CardSideService.get_side_by_id(mapping['type_id']))
+            for label, mapping in self.LABEL_TO_CARD_MAPPING.items()
+            if mapping['category_id'] is not None
+        }
+        
         self.cccd_new_keywords = ["cancuoc"]
         self.cccd_old_keywords = ["cancuoccongdan", "cuoccongdan", "congdan"]
         self.cccd_back_old_keywords = ["dacdiemnhandang", "notruoi", "cuccanhsat"]
         self.cccd_back_new_keywords = ["noicutru", "noidangkykhaisinh", "bocongan"]
+        
+        # One compiled alternation per CCCD type, checked in priority order
+        self._cccd_type_patterns = [
+            (cccd_type, re.compile("|".join(re.escape(kw.replace(" ", "")) for kw in keywords)))
+            for cccd_type, keywords in (
+                ("Old CCCD", self.cccd_old_keywords),
+                ("New CCCD", self.cccd_new_keywords),
+                ("Old CCCD Back Side", self.cccd_back_old_keywords),
+                ("New CCCD Back Side", self.cccd_back_new_keywords),
+            )
+        ]
+    
+    @classmethod
+    def get_shared(cls, model_path, config, weights_dir='weights'):
+        """CCCDDetector dùng chung cho (model_path, config, weights_dir): OCR processor chỉ load một lần"""
+        key = (model_path, astuple(config), weights_dir)
+        with _shared_cccd_detectors_lock:
+            detector = _shared_cccd_detectors.get(key)
+            if detector is None:
+                detector = cls(model_path, config, weights_dir)
+                _shared_cccd_detectors[key] = detector
+        return detector
     
     def _init_ocr_processors(self):
         """Lazy initialization of OCR processors"""
-        if self.paddle_ocr_processor is None:
-            from service.ocr.PaddletOCRApi import PaddleOCRProcessor
-            self.paddle_ocr_processor = PaddleOCRProcessor(weights_dir=self.weights_dir)
+        with self._ocr_init_lock:
+            if self.paddle_ocr_processor is None:
+                from service.ocr.PaddletOCRApi import PaddleOCRProcessor
+                self.paddle_ocr_processor = PaddleOCRProcessor(weights_dir=self.weights_dir)
       
     
     def _convert_bbox(self, bbox):
         """Convert bbox to both paddle and viet formats"""
-        if isinstance(bbox[0], (list, tuple)):
-            x_coords = [pt[0] for pt in bbox]
-            y_coords = [pt[1] for pt in bbox]
-            paddle_bbox = [min(x_coords), min(y_coords), max(x_coords), max(y_coords)]
-            viet_bbox = [list(map(float, pt)) for pt in bbox]
-            if len(viet_bbox) != 4:
-                viet_bbox = [[paddle_bbox[0], paddle_bbox[1]], [paddle_bbox[2], paddle_bbox[1]], 
-                            [paddle_bbox[2], paddle_bbox[3]], [paddle_bbox[0], paddle_bbox[3]]]
+        points = np.asarray(bbox, dtype=np.float64)
+        x1, y1, x2, y2 = self._to_xyxy(points).tolist()
+        if points.ndim == 2:
+            paddle_bbox = [x1, y1, x2, y2]
+            if len(points) == 4:
+                return paddle_bbox, points.tolist()
         else:
             paddle_bbox = bbox
-            x1, y1, x2, y2 = map(float, bbox)
-            viet_bbox = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+        viet_bbox = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
         return paddle_bbox, viet_bbox
     
     def _classify_cccd_type(self, full_image_combined):
         """Classify CCCD type based on text"""
-        from unidecode import unidecode
-        
-        if any(kw.replace(" ", "") in full_image_combined for kw in self.cccd_old_keywords):
-            return "Old CCCD"
-        elif any(kw.replace(" ", "") in full_image_combined for kw in self.cccd_new_keywords):
-            return "New CCCD"
-        elif any(kw.replace(" ", "") in full_image_combined for kw in self.cccd_back_old_keywords):
-            return "Old CCCD Back Side"
-        elif any(kw.replace(" ", "") in full_image_combined for kw in self.cccd_back_new_keywords):
-            return "New CCCD Back Side"
-        else:
-            return "Not CCCD"
+        for cccd_type, pattern in self._cccd_type_patterns:
+            if pattern.search(full_image_combined) is not None:
+                return cccd_type
+        return "Not CCCD"
     
     def _analyze_ocr_features(self, detections_raw):
         """Analyze OCR features from raw detections"""
@@ -88,105 +142,106 @@ class CCCDDetector:
             return len(ocr_features['detected_info_types']) > 0
         return False
     
-    def _calculate_bbox_area(self, bbox):
-        """Calculate the area of a bounding box"""
-        if isinstance(bbox[0], (list, tuple)):
-            x_coords = [pt[0] for pt in bbox]
-            y_coords = [pt[1] for pt in bbox]
-            width = max(x_coords) - min(x_coords)
-            height = max(y_coords) - min(y_coords)
-        else:
-            width = bbox[2] - bbox[0]
-            height = bbox[3] - bbox[1]
-        return width * height
+    @staticmethod
+    def _to_xyxy(bbox):
+        """Polygon [[x, y], ...] or [x1, y1, x2, y2] -> np.array([x1, y1, x2, y2])"""
+        points = np.asarray(bbox, dtype=np.float64)
+        if points.ndim == 1:
+            return points[:4]
+        return np.concatenate([points.min(axis=0), points.max(axis=0)])
     
-    def _bboxes_overlap(self, bbox1, bbox2, threshold=0.5):
-        """Check if two bounding boxes overlap significantly"""
-        # Convert both bboxes to [x1, y1, x2, y2] format
-        if isinstance(bbox1[0], (list, tuple)):
-            x1_coords = [pt[0] for pt in bbox1]
-            y1_coords = [pt[1] for pt in bbox1]
-            box1 = [min(x1_coords), min(y1_coords), max(x1_coords), max(y1_coords)]
-        else:
-            box1 = bbox1
-        
-        if isinstance(bbox2[0], (list, tuple)):
-            x2_coords = [pt[0] for pt in bbox2]
-            y2_coords = [pt[1] for pt in bbox2]
-            box2 = [min(x2_coords), min(y2_coords), max(x2_coords), max(y2_coords)]
-        else:
-            box2 = bbox2
-        
-        # Calculate intersection
-        x_left = max(box1[0], box2[0])
-        y_top = max(box1[1], box2[1])
-        x_right = min(box1[2], box2[2])
-        y_bottom = min(box1[3], box2[3])
-        
-        if x_right < x_left or y_bottom < y_top:
-            return False
+    @staticmethod
+    def _pairwise_iou(boxes):
+        """IoU matrix (N, N) for an (N, 4) array of [x1, y1, x2, y2] boxes"""
+        x_left = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+        y_top = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+        x_right = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+        y_bottom = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+        intersection = np.clip(x_right - x_left, 0, None) * np.clip(y_bottom - y_top, 0, None)
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        union = areas[:, None] + areas[None, :] - intersection
+        return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+    
+    def _duplicate_mask(self, detections, threshold=0.5):
+        """
+        Greedy de-duplication in detection order: a detection is a duplicate when it
+        overlaps (IoU >= threshold) a detection that was already kept
+        """
+        duplicates = np.zeros(len(detections), dtype=bool)
+        if len(detections) < 2:
+            return duplicates
         
-        intersection_area = (x_right - x_left) * (y_bottom - y_top)
-        box1_area = (box1[2] - box1[0]) * (box1[3] - box1[1])
-        box2_area = (box2[2] - box2[0]) * (box2[3] - box2[1])
+        boxes = np.array([self._to_xyxy(det.bbox) for det in detections], dtype=np.float64)
         
-        # Calculate IoU (Intersection over Union)
-        iou = intersection_area / float(box1_area + box2_area - intersection_area)
+        if _nms is not None:
+            # Strictly decreasing scores make NMS visit boxes in detection order, matching the
+            # greedy scan below; nms suppresses on IoU > thr, nudge thr down to keep ">="
+            scores = torch.arange(len(detections), 0, -1, dtype=torch.float32)
+            keep = _nms(torch.from_numpy(boxes).float(), scores, float(np.nextafter(np.float32(threshold), np.float32(0))))
+            duplicates[:] = True
+            duplicates[keep.numpy()] = False
+            return duplicates
         
-        return iou >= threshold
+        overlaps = self._pairwise_iou(boxes) >= threshold
+        for i in range(len(detections)):
+            if not duplicates[i]:
+                # Suppress every later detection overlapping this kept one
+                duplicates[i + 1:] |= overlaps[i, i + 1:]
+        return duplicates
+    
+    def _load_image(self, img_path):
+        """Decode once; detection and the OCR passes share the same array"""
+        image = img_path if isinstance(img_path, np.ndarray) else cv2.imread(img_path)
+        if image is None:
+            raise ValueError(f"Could not load image: {img_path}")
+        return image
+    
+    def _submit_full_ocr(self, image, return_json):
+        """The full-image OCR pass does not depend on the detections, start it alongside YOLO"""
+        if return_json:
+            return None
+        return _OCR_EXECUTOR.submit(self.paddle_ocr_processor.process_full_image, image)
     
     def process_image(self, img_path, filter_mode=1, verbose=True, return_json=True):
         """Process a single image and return detections with OCR results"""
         self._init_ocr_processors()
-        from unidecode import unidecode
         
-        detections_raw = self.detector.detect(img_path, filter_mode=filter_mode)
+        image = self._load_image(img_path)
+        full_future = self._submit_full_ocr(image, return_json)
+        detections_raw = self.detector.detect(image, filter_mode=filter_mode)
         
+        return self._build_image_result(img_path, image, detections_raw, full_future, verbose, return_json)
+    
+    def _build_image_result(self, img_path, image, detections_raw, full_future, verbose, return_json):
+        """Turn one image's detections into the JSON / legacy result"""
         # Filter to keep only the largest detection if multiple detections found
         
         if verbose:
-            print(f"\nProcessing: {os.path.basename(img_path)}")
-            print(f"Found {len(detections_raw)} detections:")
+            logger.debug("Processing: %s", os.path.basename(img_path) if isinstance(img_path, str) else 'ndarray')
+            logger.debug("Found %d detections", len(detections_raw))
         
         if return_json:
             # Return in JSON format as requested
             json_result = {"detections": []}
             
+            class_names = [det.class_name for det in detections_raw]
+            
             # Đếm số lượng từng class
-            class_counts = self.detector.count_detections_by_class(detections_raw)
-            json_result["class_counts"] = class_counts
+            json_result["class_counts"] = dict(Counter(class_names))
             
-            processed_bboxes = []
+            # Detections overlapping an earlier kept one are duplicates of the same region
+            duplicates = self._duplicate_mask(detections_raw, threshold=0.5)
+            if verbose:
+                for i in np.flatnonzero(duplicates):
+                    logger.debug("Skipping duplicate detection in same region: %s", class_names[i])
             
-            for det in detections_raw:
-                class_name = getattr(det, 'class_name', None)
-                confidence = getattr(det, 'confidence', 0.0)
-                current_bbox = det.bbox
-                
-                # Check if this bbox overlaps significantly with any already processed bbox
-                should_skip = False
-                for processed_bbox in processed_bboxes:
-                    if self._bboxes_overlap(current_bbox, processed_bbox, threshold=0.5):
-                        should_skip = True
-                        if verbose:
-                            print(f"\nSkipping duplicate detection in same region: {class_name}")
-                        break
-                
-                if should_skip:
-                    continue
-                
-                # Add current bbox to processed list
-                processed_bboxes.append(current_bbox)
+            for i in np.flatnonzero(~duplicates).tolist():
+                det = detections_raw[i]
+                class_name = class_names[i]
+                confidence = det.confidence
                 
                 # Get card mapping
-                card_mapping = self.LABEL_TO_CARD_MAPPING.get(class_name, None)
-                
-                if card_mapping and card_mapping['category_id'] is not None:
-                    card_category = CardService.get_card_by_id(card_mapping['category_id'])
-                    card_type = CardSideService.get_side_by_id(card_mapping['type_id'])
-                else:
-                    card_category = None
-                    card_type = None
+                card_category, card_type = self._label_card_info.get(class_name, (None, None))
                 
                 # Analyze OCR features
                 ocr_features = self._analyze_ocr_features([det])
@@ -212,11 +267,13 @@ class CCCDDetector:
                 json_result["detections"].append(detection_result)
                 
                 if verbose:
-                    print(f"\nDetection: {class_name} (confidence: {confidence:.4f})")
-                    print(f"  Card Category: {card_category['name'] if card_category else 'Unknown'}")
-                    print(f"  Card Type: {card_type['name'] if card_type else 'Unknown'}")
-                    print(f"  Valid Card: {is_valid}")
-                    print(f"  OCR Features: {ocr_features}")
+                    logger.debug(
+                        "Detection: %s (confidence: %.4f), card category: %s, card type: %s, valid card: %s, OCR features: %s",
+                        class_name, confidence,
+                        card_category['name'] if card_category else 'Unknown',
+                        card_type['name'] if card_type else 'Unknown',
+                        is_valid, ocr_features
+                    )
                     
             return json_result
         
@@ -224,31 +281,36 @@ class CCCDDetector:
             # Return in original format for backward compatibility
             results = []
             
-            for det in detections_raw:
+            if not detections_raw:
+                full_future.cancel()
+                return results
+            
+            # Per-detection crops are independent, OCR them on the pool too
+            paddle_results = _OCR_EXECUTOR.map(
+                lambda det: self.paddle_ocr_processor.process_bbox(
+                    image, self._convert_bbox(det.bbox)[0], bbox_format="xyxy"
+                ),
+                detections_raw
+            )
+            
+            full_result = full_future.result()
+            full_image_texts = full_result.get('texts', [])
+            # Spaces are stripped anyway, so join without a separator
+            full_image_combined = _to_ascii("".join(full_image_texts).lower()).replace(" ", "")
+            cccd_type = self._classify_cccd_type(full_image_combined)
+            
+            for det, paddle_result in zip(detections_raw, paddle_results):
                 label = getattr(det, 'label', None)
                 class_id = getattr(det, 'class_id', None)
                 class_name = getattr(det, 'class_name', None)
                 name = getattr(det, 'name', None)
                 
                 if verbose:
-                    print(f"Detection attributes: label={label}, class_id={class_id}, class_name={class_name}, name={name}")
-                
-                paddle_bbox = self._convert_bbox(det.bbox)
-                
-                paddle_result = self.paddle_ocr_processor.process_bbox(img_path, paddle_bbox, bbox_format="xyxy")
-                
-                full_result = self.paddle_ocr_processor.process_full_image(img_path)
-                
-                full_image_texts = full_result.get('texts', [])
-                full_image_combined = unidecode(" ".join(full_image_texts).lower()).replace(" ", "")
-                
-                cccd_type = self._classify_cccd_type(full_image_combined)
-                
-                if verbose:
-                    print("PaddleOCR Result:", paddle_result)
-                    
-                    print("Combined Full Image Texts (normalized):", full_image_combined)
-                    print(f"=> Detected as {cccd_type}")
+                    logger.debug("Detection attributes: label=%s, class_id=%s, class_name=%s, name=%s",
+                                 label, class_id, class_name, name)
+                    logger.debug("PaddleOCR Result: %s", paddle_result)
+                    logger.debug("Combined Full Image Texts (normalized): %s", full_image_combined)
+                    logger.debug("=> Detected as %s", cccd_type)
                 
                 results.append({
                     'detection': det,
@@ -260,14 +322,34 @@ class CCCDDetector:
             
             return results
     
-    def process_directory(self, image_dir, filter_mode=1, verbose=True, return_json=True):
-        """Process all images in a directory"""
+    def process_directory(self, image_dir, filter_mode=1, verbose=True, return_json=True, batch_size=8):
+        """
+        Process all images in a directory
+        
+        Images are run through YOLO in chunks of batch_size with one batched
+        predict per chunk; a single process keeps one copy of the model in VRAM.
+        """
+        self._init_ocr_processors()
+        
+        with os.scandir(image_dir) as it:
+            entries = [
+                (entry.name, entry.path) for entry in it
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+            ]
+        
         all_results = {}
-        for fname in os.listdir(image_dir):
-            if not fname.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")):
-                continue
-            img_path = os.path.join(image_dir, fname)
-            all_results[fname] = self.process_image(img_path, filter_mode, verbose, return_json)
+        for start in range(0, len(entries), batch_size):
+            chunk, img_paths = zip(*entries[start:start + batch_size])
+            images = [self._load_image(img_path) for img_path in img_paths]
+            full_futures = [self._submit_full_ocr(image, return_json) for image in images]
+            batch_detections = self.detector.detect_batch(images, filter_mode=filter_mode)
+            
+            for fname, img_path, image, detections_raw, full_future in zip(
+                chunk, img_paths, images, batch_detections, full_futures
+            ):
+                all_results[fname] = self._build_image_result(
+                    img_path, image, detections_raw, full_future, verbose, return_json
+                )
         return all_results
 
 
@@ -12,6 +12,40 @@ from utils import util
 filterwarnings("ignore")
 
 
+class OpenVINOSession:
+    """
+    Adapter cho OpenVINO compiled model với interface giống onnxruntime.InferenceSession
+    (get_inputs / run) để dùng trực tiếp với nets.nn
+    """
+    
+    def __init__(self, onnx_path: str, device: str = 'CPU'):
+        import threading
+        from types import SimpleNamespace
+        import openvino as ov
+        
+        core = ov.Core()
+        self.model = core.compile_model(onnx_path, device, {'PERFORMANCE_HINT': 'THROUGHPUT'})
+        self._inputs = [
+            SimpleNamespace(
+                name=port.get_any_name(),
+                shape=[dim.get_length() if dim.is_static else 'dynamic' for dim in port.get_partial_shape()]
+            )
+            for port in self.model.inputs
+        ]
+        # Infer request không thread-safe, mỗi thread giữ một request riêng
+        self._local = threading.local()
+    
+    def get_inputs(self):
+        return self._inputs
+    
+    def run(self, output_names, input_feed: Dict) -> List[np.ndarray]:
+        request = getattr(self._local, 'request', None)
+        if request is None:
+            request = self._local.request = self.model.create_infer_request()
+        results = request.infer(input_feed)
+        return [results[output] for output in self.model.outputs]
+
+
 class PaddleOCRProcessor:
     """
     Class xử lý OCR sử dụng PaddleOCR models
@@ -20,22 +54,43 @@ class PaddleOCRProcessor:
     2. Recognize text từ bbox cụ thể
     """
     
-    def __init__(self, weights_dir: str = 'weights'):
+    def __init__(self, weights_dir: str = 'weights', backend: str = 'onnxrt',
+                 recognition_precision: str = 'fp32'):
         """
         Khởi tạo PaddleOCRProcessor
         
         Args:
             weights_dir: Đường dẫn đến folder chứa các file weights ONNX
+            backend: 'onnxrt' (ONNX Runtime) hoặc 'openvino' (OpenVINO, THROUGHPUT mode trên CPU)
+            recognition_precision: 'fp32', 'int8' hoặc 'fp16' cho model recognition
         """
+        if backend not in ('onnxrt', 'openvino'):
+            raise ValueError(f"Unsupported backend: {backend}. Use 'onnxrt' or 'openvino'.")
         self.weights_dir = weights_dir
+        self.backend = backend
+        
+        recognition_path = self._resource_path(f'{weights_dir}/recognition.onnx')
+        if recognition_precision != 'fp32':
+            # Quantized copy được tạo lần đầu và lưu cạnh file gốc
+            from paddleocr_onnx.utils import convert_model
+            recognition_path = convert_model(recognition_path, recognition_precision)
         
         # Initialize models
-        self.detection = nn.Detection(self._resource_path(f'{weights_dir}/detection.onnx'))
-        self.recognition = nn.Recognition(self._resource_path(f'{weights_dir}/recognition.onnx'))
-        self.classification = nn.Classification(self._resource_path(f'{weights_dir}/classification.onnx'))
+        detection_path = self._resource_path(f'{weights_dir}/detection.onnx')
+        classification_path = self._resource_path(f'{weights_dir}/classification.onnx')
+        self.detection = nn.Detection(detection_path, self._create_session(detection_path))
+        self.recognition = nn.Recognition(recognition_path, self._create_session(recognition_path))
+        self.classification = nn.Classification(classification_path, self._create_session(classification_path))
         
         print(f"✓ PaddleOCRProcessor initialized successfully!")
         print(f"  - Weights directory: {weights_dir}")
+        print(f"  - Backend: {backend}, recognition precision: {recognition_precision}")
+    
+    def _create_session(self, onnx_path: str):
+        """Session cho backend đã chọn; None để nn.* tự tạo ONNX Runtime session"""
+        if self.backend == 'openvino':
+            return OpenVINOSession(onnx_path)
+        return None
     
     def _resource_path(self, relative_path: str) -> str:
         """Get absolute path to resource, works for dev and for PyInstaller"""
@@ -101,6 +156,56 @@ class PaddleOCRProcessor:
         
         return result
     
+    def process_full_image_batch(self, images: List[Union[str, np.ndarray]]) -> List[Dict]:
+        """
+        Xử lý nhiều ảnh: detection chạy từng ảnh, classification và recognition
+        chạy gộp trên toàn bộ crops của tất cả ảnh
+        
+        Args:
+            images: List đường dẫn ảnh hoặc numpy array
+            
+        Returns:
+            List Dict giống process_full_image, cùng thứ tự với images
+        """
+        all_points = []
+        all_crops = []
+        for image in images:
+            # Load image if path is provided
+            if isinstance(image, str):
+                frame = cv2.imread(image)
+            else:
+                frame = image
+            
+            if frame is None:
+                raise ValueError("Cannot load image")
+            
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            
+            points = self.detection(rgb_frame)
+            points = util.sort_polygon(list(points))
+            all_points.append(points)
+            all_crops.extend(util.crop_image(rgb_frame, x) for x in points)
+        
+        texts, confidences = [], []
+        if all_crops:
+            all_crops, angles = self.classification(all_crops)
+            texts, confidences = self.recognition(all_crops)
+        
+        # Split flat results back per image
+        results = []
+        start = 0
+        for points in all_points:
+            end = start + len(points)
+            results.append({
+                'texts': texts[start:end],
+                'confidences': confidences[start:end],
+                'bboxes': points,
+                'count': end - start
+            })
+            start = end
+        
+        return results
+    
     def process_bbox(self, image: Union[str, np.ndarray], bbox: List, bbox_format: str = "polygon") -> Dict:
         """
         Xử lý text trong một bbox cụ thể
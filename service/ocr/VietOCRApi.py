@@ -57,11 +57,88 @@ class VietOCRProcessor:
             - 'confidence': Độ tin cậy (luôn 1.0 với VietOCR)
             - 'bbox': Bbox đã normalize thành polygon format
         """
+        image_pil = self._to_pil(image)
+        img_width, img_height = image_pil.size
+        polygon_bbox, crop_box = self._crop_box(bbox, bbox_format, img_width, img_height)
+        
+        # Crop image
+        try:
+            cropped_image = image_pil.crop(crop_box)
+            
+            # Recognize text
+            text = self.predictor.predict(cropped_image)
+            
+            return {
+                'text': text if text else "",
+                'confidence': 1.0,  # VietOCR không trả confidence
+                'bbox': polygon_bbox
+            }
+        
+        except Exception as e:
+            print(f"Error processing bbox: {e}")
+            return {
+                'text': "",
+                'confidence': 0.0,
+                'bbox': polygon_bbox
+            }
+    
+    def process_bboxes_batch(
+        self,
+        image,
+        bboxes,
+        bbox_format: str = "xyxy"
+    ):
+        """
+        Nhận dạng nhiều bbox trong cùng một ảnh bằng một lần gọi batch
+        (Predictor.predict_batch gom các crop cùng bucket chiều rộng, pad và chạy decoder một lần)
+        
+        Args:
+            image: Đường dẫn ảnh hoặc PIL Image hoặc numpy array
+            bboxes: List các bbox
+            bbox_format: Format của bbox
+            
+        Returns:
+            List of dict giống process_bbox, cùng thứ tự với bboxes
+        """
+        if not bboxes:
+            return []
+        
+        # Ảnh chỉ được load/convert một lần cho tất cả bbox
+        image_pil = self._to_pil(image)
+        img_width, img_height = image_pil.size
+        
+        polygons = []
+        crops = []
+        for bbox in bboxes:
+            polygon_bbox, crop_box = self._crop_box(bbox, bbox_format, img_width, img_height)
+            polygons.append(polygon_bbox)
+            crops.append(image_pil.crop(crop_box))
+        
+        try:
+            texts = self.predictor.predict_batch(crops)
+        except Exception as e:
+            print(f"Error processing bbox batch: {e}")
+            return [
+                {'text': "", 'confidence': 0.0, 'bbox': polygon_bbox}
+                for polygon_bbox in polygons
+            ]
+        
+        return [
+            {
+                'text': text if text else "",
+                'confidence': 1.0,  # VietOCR không trả confidence
+                'bbox': polygon_bbox
+            }
+            for text, polygon_bbox in zip(texts, polygons)
+        ]
+    
+    @staticmethod
+    def _to_pil(image):
+        """Đường dẫn / numpy array (BGR) / PIL Image -> PIL Image"""
         # Load image if path is provided
         if isinstance(image, str):
-            image_pil = Image.open(image)
-            img_width, img_height = image_pil.size
-        elif isinstance(image, np.ndarray):
+            return Image.open(image)
+        if isinstance(image, np.ndarray):
             # Convert numpy array to PIL
             if len(image.shape) == 3:
                 if image.shape[2] == 3:  # BGR
@@ -71,12 +148,11 @@ class VietOCRProcessor:
             else:
                 image_rgb = image
             
-            image_pil = Image.fromarray(image_rgb.astype('uint8'))
-            img_width, img_height = image_pil.size
-        else:
-            image_pil = image
-            img_width, img_height = image_pil.size
-        
+            return Image.fromarray(image_rgb.astype('uint8'))
+        return image
+    
+    def _crop_box(self, bbox, bbox_format, img_width, img_height):
+        """Normalize bbox, trả về (polygon_bbox, (x1, y1, x2, y2)) đã clamp trong ảnh"""
         # Auto-detect bbox format when caller passes a polygon but leaves default
         # (many detectors return polygon points; callers sometimes forget to set bbox_format)
         try:
@@ -102,26 +178,7 @@ class VietOCRProcessor:
         x2 = min(img_width, int(x2))
         y2 = min(img_height, int(y2))
         
-        # Crop image
-        try:
-            cropped_image = image_pil.crop((x1, y1, x2, y2))
-            
-            # Recognize text
-            text = self.predictor.predict(cropped_image)
-            
-            return {
-                'text': text if text else "",
-                'confidence': 1.0,  # VietOCR không trả confidence
-                'bbox': polygon_bbox
-            }
-        
-        except Exception as e:
-            print(f"Error processing bbox: {e}")
-            return {
-                'text': "",
-                'confidence': 0.0,
-                'bbox': polygon_bbox
-            }
+        return polygon_bbox, (x1, y1, x2, y2)
     
     def _normalize_bbox(self, bbox, bbox_format, img_width, img_height):
         """
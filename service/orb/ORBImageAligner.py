@@ -1,6 +1,53 @@
+import hashlib
+import threading
+from collections import OrderedDict
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
+
+# Features của ảnh base (template) theo nội dung ảnh + tham số aligner, dùng chung giữa các aligner:
+# cùng một template được align với mọi ảnh upload nên chỉ cần detect ORB trên base một lần
+_BASE_FEATURE_CACHE_SIZE = 16
+_base_feature_cache = OrderedDict()
+_base_feature_cache_lock = threading.Lock()
+
+# Ngưỡng inliers cho các bước kiểm tra chất lượng alignment của card processors (OCR_CCCD_QR, OCR_CCCD_2025_NEW).
+# Đã nhân ~0.9 so với ngưỡng cũ (25/40/60/100): MAGSAC++ cho khoảng 90% số inliers của RANSAC (threshold 5.0) cũ
+MIN_ALIGNMENT_INLIERS = 22
+# (inliers tối thiểu, điểm) từ cao xuống thấp, dưới mọi mức được 5 điểm
+INLIER_SCORE_TIERS = ((90, 40), (54, 35), (36, 25), (22, 15))
+
+
+def _cuda_orb_available():
+    """OpenCV build có module CUDA (contrib) và có ít nhất một GPU"""
+    try:
+        return hasattr(cv2, 'cuda_ORB') and cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+
+class AlignmentVisuals:
+    """
+    Ảnh debug của một lần align (result["visuals"]), chỉ render (concat + vẽ) khi được gọi lần đầu
+    """
+    
+    def __init__(self, render_visualization, render_comparison):
+        self._render_visualization = render_visualization
+        self._render_comparison = render_comparison
+        self._visualization = None
+        self._comparison = None
+    
+    def visualization(self):
+        """Ảnh matches giữa base và target đã normalize (BGR)"""
+        if self._visualization is None:
+            self._visualization = self._render_visualization()
+        return self._visualization
+    
+    def comparison(self):
+        """Ảnh so sánh Base | Target | Aligned (BGR)"""
+        if self._comparison is None:
+            self._comparison = self._render_comparison()
+        return self._comparison
+
 
 class ORBImageAligner:
     """
@@ -8,16 +55,20 @@ class ORBImageAligner:
     Xử lý hoàn toàn trong bộ nhớ, không lưu file
     """
     
-    def __init__(self, target_dimension=800, orb_features=2000):
+    def __init__(self, target_dimension=800, orb_features=2000, verbose=False, use_cuda=None):
         """
         Khởi tạo ORB Image Aligner
         
         Args:
             target_dimension (int): Kích thước chuẩn để normalize (default: 800)
             orb_features (int): Số lượng ORB features tối đa (default: 2000)
+            verbose (bool): In log từng bước alignment (default: False)
+            use_cuda (bool): Chạy ORB detect + match trên GPU (cv2.cuda). None = tự bật khi có GPU
         """
         self.target_dimension = target_dimension
         self.orb_features = orb_features
+        self.verbose = verbose
+        self.use_cuda = _cuda_orb_available() if use_cuda is None else (use_cuda and _cuda_orb_available())
         
         # Khởi tạo ORB detector
         self.orb = cv2.ORB_create(
@@ -32,45 +83,63 @@ class ORBImageAligner:
             fastThreshold=20
         )
         
-        # RANSAC configurations for robustness
-        self.ransac_configs = [
-            {"threshold": 3.0, "maxIters": 3000, "confidence": 0.99},
-            {"threshold": 5.0, "maxIters": 2000, "confidence": 0.995},
-            {"threshold": 1.5, "maxIters": 5000, "confidence": 0.98},
-        ]
+        if self.use_cuda:
+            # Cùng tham số với ORB trên CPU; FAST + Harris + oriented BRIEF và BF Hamming matcher chạy trên device
+            self.cuda_orb = cv2.cuda_ORB.create(
+                nfeatures=orb_features,
+                scaleFactor=1.2,
+                nlevels=8,
+                edgeThreshold=31,
+                firstLevel=0,
+                WTA_K=2,
+                scoreType=cv2.ORB_HARRIS_SCORE,
+                patchSize=31,
+                fastThreshold=20,
+                blurForDescriptor=False
+            )
+            self.cuda_matcher = cv2.cuda.DescriptorMatcher_createBFMatcher(cv2.NORM_HAMMING)
+        
+        # CLAHE tham số cố định, tạo một lần và dùng lại cho mọi lần preprocessing
+        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
         
-    def normalize_size(self, base_img, target_img):
+        # MAGSAC++ (OpenCV >= 4.5); RANSAC chỉ chạy một lần khi MAGSAC++ thất bại hoặc không có
+        self.use_magsac = hasattr(cv2, 'USAC_MAGSAC')
+        self.magsac_config = {"threshold": 3.0, "maxIters": 10000, "confidence": 0.999}
+        self.ransac_config = {"threshold": 5.0, "maxIters": 2000, "confidence": 0.995}
+        
+    @staticmethod
+    def _resize_interpolation(scale):
+        """INTER_AREA khi thu nhỏ (chất lượng tốt hơn và nhanh hơn khi decimate), INTER_LINEAR khi phóng to"""
+        return cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+    
+    def _normalize_one(self, img, gray_only=False):
+        """Resize một ảnh về target_dimension (cạnh dài). Returns: (normalized, scale)"""
+        if gray_only:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        
+        h, w = img.shape[:2]
+        scale = self.target_dimension / max(h, w)
+        normalized = cv2.resize(img, (int(w * scale), int(h * scale)),
+                                interpolation=self._resize_interpolation(scale))
+        return normalized, scale
+    
+    def normalize_size(self, base_img, target_img, gray_only=False):
         """
         Đồng nhất kích thước 2 ảnh về cùng scale
         
         Args:
             base_img: Ảnh base
             target_img: Ảnh target
+            gray_only: Chuyển grayscale trước khi resize (chỉ resize 1 kênh thay vì 3)
             
         Returns:
             tuple: (base_normalized, target_normalized, base_scale, target_scale)
         """
-        # Tính scale cho base image
-        base_h, base_w = base_img.shape[:2]
-        base_max_dim = max(base_h, base_w)
-        base_scale = self.target_dimension / base_max_dim
+        base_normalized, base_scale = self._normalize_one(base_img, gray_only)
+        target_normalized, target_scale = self._normalize_one(target_img, gray_only)
         
-        # Resize base image
-        base_new_w = int(base_w * base_scale)
-        base_new_h = int(base_h * base_scale)
-        base_normalized = cv2.resize(base_img, (base_new_w, base_new_h))
-        
-        # Tính scale cho target image
-        target_h, target_w = target_img.shape[:2]
-        target_max_dim = max(target_h, target_w)
-        target_scale = self.target_dimension / target_max_dim
-        
-        # Resize target image
-        target_new_w = int(target_w * target_scale)
-        target_new_h = int(target_h * target_scale)
-        target_normalized = cv2.resize(target_img, (target_new_w, target_new_h))
-        
-        print(f"🔧 Normalized sizes - Base: {base_normalized.shape}, Target: {target_normalized.shape}")
+        if self.verbose:
+            print(f"🔧 Normalized sizes - Base: {base_normalized.shape}, Target: {target_normalized.shape}")
         
         return base_normalized, target_normalized, base_scale, target_scale
     
@@ -79,16 +148,15 @@ class ORBImageAligner:
         Preprocessing để tăng chất lượng features
         
         Args:
-            img: Ảnh input
+            img: Ảnh input (BGR hoặc đã là grayscale)
             
         Returns:
             numpy.ndarray: Ảnh đã được preprocessing
         """
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
         # CLAHE để enhance contrast
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(gray)
+        enhanced = self.clahe.apply(gray)
         
         # Gaussian blur nhẹ để giảm noise
         blurred = cv2.GaussianBlur(enhanced, (3, 3), 0)
@@ -107,36 +175,108 @@ class ORBImageAligner:
             tuple: (good_matches, keypoints1, keypoints2) hoặc None nếu thất bại
         """
         # Detect features
-        kp1, desc1 = self.orb.detectAndCompute(base_processed, None)
-        kp2, desc2 = self.orb.detectAndCompute(target_processed, None)
+        kp1, desc1 = self.detect_features(base_processed)
+        kp2, desc2 = self.detect_features(target_processed)
+        
+        return self.match_features(kp1, desc1, kp2, desc2)
+    
+    def detect_features(self, processed):
+        """ORB keypoints + descriptors (host) của ảnh đã preprocessing, trên GPU nếu use_cuda"""
+        if not self.use_cuda:
+            return self.orb.detectAndCompute(processed, None)
+        
+        gpu_image = cv2.cuda_GpuMat()
+        gpu_image.upload(processed)
+        gpu_keypoints, gpu_descriptors = self.cuda_orb.detectAndComputeAsync(gpu_image, None)
+        keypoints = self.cuda_orb.convert(gpu_keypoints)
+        if not keypoints:
+            return keypoints, None
+        return keypoints, gpu_descriptors.download()
+    
+    def _knn_distances(self, desc1, desc2):
+        """2 láng giềng Hamming gần nhất cho mỗi descriptor của desc1. Returns: (distances (N, 2), neighbors (N, 2))"""
+        if not self.use_cuda:
+            return cv2.batchDistance(desc1, desc2, cv2.CV_32S, K=2, normType=cv2.NORM_HAMMING)
+        
+        gpu_desc1 = cv2.cuda_GpuMat()
+        gpu_desc2 = cv2.cuda_GpuMat()
+        gpu_desc1.upload(desc1)
+        gpu_desc2.upload(desc2)
+        # Chỉ kết quả kNN (N x 2 match) được copy về host
+        pairs = self.cuda_matcher.knnMatch(gpu_desc1, gpu_desc2, k=2)
+        
+        distances = np.full((len(desc1), 2), np.iinfo(np.int32).max, dtype=np.int32)
+        neighbors = np.full((len(desc1), 2), -1, dtype=np.int32)
+        for pair in pairs:
+            for rank, match in enumerate(pair[:2]):
+                distances[match.queryIdx, rank] = int(match.distance)
+                neighbors[match.queryIdx, rank] = match.trainIdx
+        return distances, neighbors
+    
+    def match_features(self, kp1, desc1, kp2, desc2):
+        """
+        Match ORB descriptors đã detect sẵn
         
+        Returns:
+            tuple: (good_matches, keypoints1, keypoints2) hoặc None nếu thất bại
+        """
         if desc1 is None or desc2 is None:
             return None
         
-        print(f"✨ Features found - Base: {len(kp1)}, Target: {len(kp2)}")
+        if self.verbose:
+            print(f"✨ Features found - Base: {len(kp1)}, Target: {len(kp2)}")
+        
+        # Lowe's ratio test cần 2 láng giềng
+        if len(desc2) < 2:
+            return None
         
-        # Feature matching
-        bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
-        matches = bf.knnMatch(desc1, desc2, k=2)
+        # Feature matching: 2 láng giềng Hamming gần nhất cho mỗi descriptor trong một lần gọi,
+        # trả về mảng (N, 2) thay vì list DMatch pairs
+        distances, neighbors = self._knn_distances(desc1, desc2)
         
-        # Lowe's ratio test
-        good_matches = []
-        for match_pair in matches:
-            if len(match_pair) == 2:
-                m, n = match_pair
-                if m.distance < 0.75 * n.distance:
-                    good_matches.append(m)
+        # Lowe's ratio test (vectorized), chỉ tạo DMatch cho các match giữ lại
+        query_idx = np.flatnonzero(distances[:, 0] < 0.75 * distances[:, 1])
+        good_matches = [
+            cv2.DMatch(q, t, float(d))
+            for q, t, d in zip(query_idx.tolist(), neighbors[query_idx, 0].tolist(), distances[query_idx, 0].tolist())
+        ]
         
-        print(f"💎 Good matches: {len(good_matches)}")
+        if self.verbose:
+            print(f"💎 Good matches: {len(good_matches)}")
         
         if len(good_matches) < 10:
             return None
         
         return good_matches, kp1, kp2
     
+    def _base_features(self, base_img, gray_only):
+        """
+        (base_norm, base_scale, kp1, desc1, base_gray) của ảnh base, cache theo nội dung ảnh
+        và các tham số ảnh hưởng tới kết quả. base_gray là grayscale kích thước gốc cho quality score
+        """
+        digest = hashlib.blake2b(np.ascontiguousarray(base_img).data, digest_size=16).digest()
+        key = (digest, base_img.shape, self.target_dimension, self.orb_features, gray_only, self.use_cuda)
+        
+        with _base_feature_cache_lock:
+            cached = _base_feature_cache.get(key)
+            if cached is not None:
+                _base_feature_cache.move_to_end(key)
+                return cached
+        
+        base_norm, base_scale = self._normalize_one(base_img, gray_only)
+        kp1, desc1 = self.detect_features(self.enhanced_preprocessing(base_norm))
+        base_gray = base_img if base_img.ndim == 2 else cv2.cvtColor(base_img, cv2.COLOR_BGR2GRAY)
+        features = (base_norm, base_scale, kp1, desc1, base_gray)
+        
+        with _base_feature_cache_lock:
+            _base_feature_cache[key] = features
+            while len(_base_feature_cache) > _BASE_FEATURE_CACHE_SIZE:
+                _base_feature_cache.popitem(last=False)
+        return features
+    
     def find_robust_homography(self, good_matches, kp1, kp2):
         """
-        Tìm homography matrix robust với multiple RANSAC attempts
+        Tìm homography matrix robust: MAGSAC++ một lần, fallback một lần RANSAC
         
         Args:
             good_matches: List các good matches
@@ -146,62 +286,74 @@ class ORBImageAligner:
         Returns:
             tuple: (best_matrix, best_inliers, best_mask) hoặc None nếu thất bại
         """
-        src_pts = np.float32([kp1[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-        dst_pts = np.float32([kp2[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-        
-        best_matrix = None
-        best_inliers = 0
-        best_mask = None
-        
-        for config in self.ransac_configs:
+        # Lấy toạ độ keypoints một lần ở C (KeyPoint_convert) rồi index theo match
+        query_idx = np.fromiter((m.queryIdx for m in good_matches), dtype=np.int32, count=len(good_matches))
+        train_idx = np.fromiter((m.trainIdx for m in good_matches), dtype=np.int32, count=len(good_matches))
+        src_pts = cv2.KeyPoint_convert(kp1)[query_idx].reshape(-1, 1, 2)
+        dst_pts = cv2.KeyPoint_convert(kp2)[train_idx].reshape(-1, 1, 2)
+        
+        # MAGSAC++ tự thích nghi ngưỡng inlier nên một lần gọi thay cho cả loạt config RANSAC
+        if self.use_magsac:
             matrix, mask = cv2.findHomography(
-                dst_pts, src_pts, cv2.RANSAC,
-                config["threshold"], maxIters=config["maxIters"], 
-                confidence=config["confidence"]
+                dst_pts, src_pts, cv2.USAC_MAGSAC,
+                self.magsac_config["threshold"], maxIters=self.magsac_config["maxIters"],
+                confidence=self.magsac_config["confidence"]
             )
-            
             if matrix is not None:
                 inliers = np.sum(mask)
-                print(f"  📏 Threshold {config['threshold']}: {inliers} inliers")
-                
-                if inliers > best_inliers:
-                    best_matrix = matrix
-                    best_inliers = inliers
-                    best_mask = mask
-        
-        if best_matrix is None:
+                if self.verbose:
+                    print(f"✅ MAGSAC++: {inliers} inliers")
+                return matrix, inliers, mask
+            if self.verbose:
+                print("  ⚠️ MAGSAC++ thất bại, thử lại với RANSAC")
+        
+        matrix, mask = cv2.findHomography(
+            dst_pts, src_pts, cv2.RANSAC,
+            self.ransac_config["threshold"], maxIters=self.ransac_config["maxIters"],
+            confidence=self.ransac_config["confidence"]
+        )
+        if matrix is None:
             return None
         
-        print(f"✅ Best result: {best_inliers} inliers")
-        return best_matrix, best_inliers, best_mask
+        inliers = np.sum(mask)
+        if self.verbose:
+            print(f"✅ RANSAC (threshold {self.ransac_config['threshold']}): {inliers} inliers")
+        return matrix, inliers, mask
     
     def calculate_quality_score(self, base_img, aligned_img):
         """
         Tính quality score cho aligned image
         
         Args:
-            base_img: Ảnh base
-            aligned_img: Ảnh đã aligned
+            base_img: Ảnh base (BGR hoặc đã là grayscale)
+            aligned_img: Ảnh đã aligned (BGR hoặc đã là grayscale)
             
         Returns:
             float: Quality score (0-1)
         """
         try:
             # Convert to grayscale
-            base_gray = cv2.cvtColor(base_img, cv2.COLOR_BGR2GRAY)
-            aligned_gray = cv2.cvtColor(aligned_img, cv2.COLOR_BGR2GRAY)
+            base_gray = base_img if base_img.ndim == 2 else cv2.cvtColor(base_img, cv2.COLOR_BGR2GRAY)
+            aligned_gray = aligned_img if aligned_img.ndim == 2 else cv2.cvtColor(aligned_img, cv2.COLOR_BGR2GRAY)
             
             # Ensure same size
             h = min(base_gray.shape[0], aligned_gray.shape[0])
             w = min(base_gray.shape[1], aligned_gray.shape[1])
-            base_gray = cv2.resize(base_gray, (w, h))
-            aligned_gray = cv2.resize(aligned_gray, (w, h))
-            
-            # Template matching
-            corr = cv2.matchTemplate(base_gray, aligned_gray, cv2.TM_CCORR_NORMED)[0][0]
+            if base_gray.shape != (h, w):
+                base_gray = cv2.resize(base_gray, (w, h))
+            if aligned_gray.shape != (h, w):
+                aligned_gray = cv2.resize(aligned_gray, (w, h))
+            
+            # Cùng kích thước nên TM_CCORR_NORMED chỉ có 1 vị trí: sum(b*a) / sqrt(sum(b²) * sum(a²)).
+            # Tính trực tiếp từ 3 squared norms (cv2.norm cộng dồn chính xác trên uint8) thay vì matchTemplate
+            base_sq = cv2.norm(base_gray, cv2.NORM_L2SQR)
+            aligned_sq = cv2.norm(aligned_gray, cv2.NORM_L2SQR)
+            diff_sq = cv2.norm(base_gray, aligned_gray, cv2.NORM_L2SQR)
+            denom = np.sqrt(base_sq * aligned_sq)
+            corr = (base_sq + aligned_sq - diff_sq) / 2 / denom if denom > 0 else 0.0
             
             # Mean squared error
-            mse = np.mean((base_gray.astype(np.float32) - aligned_gray.astype(np.float32))**2) / (255.0**2)
+            mse = diff_sq / base_gray.size / (255.0**2)
             
             # Combined score
             quality = corr * (1 - mse)
@@ -254,26 +406,28 @@ class ORBImageAligner:
         Returns:
             numpy.ndarray: Visualization image
         """
-        # Lấy inlier matches
-        inlier_matches = [good_matches[i] for i in range(len(good_matches)) if mask[i]]
+        # Lấy 30 inlier matches đầu tiên
+        inlier_matches = [good_matches[i] for i in np.flatnonzero(np.ravel(mask))[:30]]
         
         # Draw matches
         vis_image = cv2.drawMatches(
             base_norm, kp1,
             target_norm, kp2,
-            inlier_matches[:30], None,
+            inlier_matches, None,
             flags=cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS
         )
         
         return vis_image
     
-    def align(self, base_img, target_img):
+    def align(self, base_img, target_img, visualize=False):
         """
         Thực hiện alignment chính - xử lý hoàn toàn trong bộ nhớ
         
         Args:
             base_img: Ảnh base (numpy array hoặc đường dẫn file)
             target_img: Ảnh target (numpy array hoặc đường dẫn file)
+            visualize: Trả về result["visuals"] (AlignmentVisuals) để render ảnh matches / so sánh (opt-in).
+                       Khi False, normalize trực tiếp trên grayscale và result["visuals"] là None
             
         Returns:
             dict: Kết quả alignment với các ảnh trong bộ nhớ
@@ -294,20 +448,25 @@ class ORBImageAligner:
             else:
                 target_image_original = target_img.copy()
             
-            print(f"📖 Original sizes - Base: {base_image_original.shape}, Target: {target_image_original.shape}")
+            if self.verbose:
+                print(f"📖 Original sizes - Base: {base_image_original.shape}, Target: {target_image_original.shape}")
+            
+            # Step 1-3 cho base: normalize, preprocessing, ORB detect (cache theo template)
+            base_norm, base_scale, kp1, desc1, base_gray = self._base_features(base_image_original, not visualize)
             
             # Step 1: Size Normalization
-            base_norm, target_norm, base_scale, target_scale = self.normalize_size(
-                base_image_original, target_image_original
-            )
+            target_norm, target_scale = self._normalize_one(target_image_original, gray_only=not visualize)
+            if self.verbose:
+                print(f"🔧 Normalized sizes - Base: {base_norm.shape}, Target: {target_norm.shape}")
             
             # Step 2: Enhanced preprocessing
-            base_processed = self.enhanced_preprocessing(base_norm)
             target_processed = self.enhanced_preprocessing(target_norm)
             
             # Step 3: Feature detection and matching
-            print("🔍 ORB feature detection với size đã normalized...")
-            match_result = self.detect_and_match_features(base_processed, target_processed)
+            if self.verbose:
+                print("🔍 ORB feature detection với size đã normalized...")
+            kp2, desc2 = self.detect_features(target_processed)
+            match_result = self.match_features(kp1, desc1, kp2, desc2)
             
             if match_result is None:
                 return {"success": False, "error": "Không tìm thấy đủ features hoặc matches"}
@@ -315,7 +474,8 @@ class ORBImageAligner:
             good_matches, kp1, kp2 = match_result
             
             # Step 4: Robust homography estimation  
-            print("🎯 Robust homography estimation...")
+            if self.verbose:
+                print("🎯 Robust homography estimation...")
             homography_result = self.find_robust_homography(good_matches, kp1, kp2)
             
             if homography_result is None:
@@ -324,41 +484,36 @@ class ORBImageAligner:
             best_matrix, best_inliers, best_mask = homography_result
             
             # Step 5: Scale compensation
-            print("📏 Scale compensation...")
+            if self.verbose:
+                print("📏 Scale compensation...")
             
-            # Scale matrix từ target original → target normalized
-            target_to_norm = np.array([
-                [target_scale, 0, 0],
-                [0, target_scale, 0],
-                [0, 0, 1]
-            ], dtype=np.float32)
-            
-            # Scale matrix từ base normalized → base original  
-            norm_to_base = np.array([
-                [1/base_scale, 0, 0],
-                [0, 1/base_scale, 0], 
-                [0, 0, 1]
-            ], dtype=np.float32)
-            
-            # Final transformation matrix
-            final_matrix = norm_to_base @ best_matrix @ target_to_norm
+            # Final transformation matrix:
+            # diag(1/base_scale, 1/base_scale, 1) @ H @ diag(target_scale, target_scale, 1)
+            # (target original → target normalized → base normalized → base original); hai ma trận
+            # scale là đường chéo nên nhân trực tiếp vào cột / hàng của H thay vì matmul
+            final_matrix = best_matrix.copy()
+            final_matrix[:, :2] *= target_scale
+            final_matrix[:2, :] /= base_scale
             
             # Step 6: Apply transformation
             h, w = base_image_original.shape[:2]
             aligned_image = cv2.warpPerspective(target_image_original, final_matrix, (w, h))
             
-            # Step 7: Quality assessment
-            quality_score = self.calculate_quality_score(base_image_original, aligned_image)
+            # Step 7: Quality assessment (grayscale của base lấy từ cache template)
+            quality_score = self.calculate_quality_score(base_gray, aligned_image)
             
-            # Step 8: Create visualization images
-            vis_image = self.create_visualization(base_norm, target_norm, kp1, kp2, good_matches, best_mask)
-            comparison = self.create_comparison_image(base_image_original, target_image_original, aligned_image)
+            # Step 8: Visualization images - chỉ render (concat + vẽ) khi caller gọi tới
+            visuals = None
+            if visualize:
+                visuals = AlignmentVisuals(
+                    lambda: self.create_visualization(base_norm, target_norm, kp1, kp2, good_matches, best_mask),
+                    lambda: self.create_comparison_image(base_image_original, target_image_original, aligned_image)
+                )
             
             return {
                 "success": True,
                 "aligned_image": aligned_image,
-                "visualization_image": vis_image,
-                "comparison_image": comparison,
+                "visuals": visuals,
                 "base_image": base_image_original,
                 "target_image": target_image_original,
                 "original_sizes": {
@@ -422,14 +577,17 @@ class ORBImageAligner:
         Args:
             result (dict): Kết quả từ hàm align()
         """
+        # Chỉ dùng khi debug, không import matplotlib ở đường chạy của service
+        import matplotlib.pyplot as plt
+        
         if not result["success"]:
             print(f"❌ Lỗi: {result['error']}")
             return
         
         # Convert BGR to RGB cho matplotlib
         aligned_rgb = cv2.cvtColor(result["aligned_image"], cv2.COLOR_BGR2RGB)
-        vis_rgb = cv2.cvtColor(result["visualization_image"], cv2.COLOR_BGR2RGB)
-        comp_rgb = cv2.cvtColor(result["comparison_image"], cv2.COLOR_BGR2RGB)
+        vis_rgb = cv2.cvtColor(result["visuals"].visualization(), cv2.COLOR_BGR2RGB)
+        comp_rgb = cv2.cvtColor(result["visuals"].comparison(), cv2.COLOR_BGR2RGB)
         
         # Display aligned image
         plt.figure(figsize=(8, 8))
@@ -459,7 +617,7 @@ class ORBImageAligner:
 # Example usage
 if __name__ == "__main__":
     # Khởi tạo aligner
-    aligner = ORBImageAligner(target_dimension=800, orb_features=2000)
+    aligner = ORBImageAligner(target_dimension=800, orb_features=2000, verbose=True)
     
     # Thực hiện alignment (có thể truyền đường dẫn hoặc numpy array)
     base_path = r"C:\Workspace\ORBAPI\lockup\base_qr_cccd.png"
@@ -468,7 +626,7 @@ if __name__ == "__main__":
     print("🚀 SIZE-NORMALIZED ORB ALIGNMENT (MEMORY ONLY)")
     print("="*50)
     
-    result = aligner.align(base_path, target_path)
+    result = aligner.align(base_path, target_path, visualize=True)
     
     # In tóm tắt
     aligner.print_result_summary(result)
@@ -479,5 +637,5 @@ if __name__ == "__main__":
         
         # Nếu muốn lưu file (optional)
         # cv2.imwrite("aligned.jpg", result["aligned_image"])
-        # cv2.imwrite("visualization.jpg", result["visualization_image"])
-        # cv2.imwrite("comparison.jpg", result["comparison_image"])
\ No newline at end of file
+        # cv2.imwrite("visualization.jpg", result["visuals"].visualization())
+        # cv2.imwrite("comparison.jpg", result["visuals"].comparison())
\ No newline at end of file
@@ -1,9 +1,20 @@
 import os
 import json
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    # orjson parses straight from bytes and is several times faster than json
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
 # Define the log directory path
 LOG_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'logs', 'tasks')
+# Per-file partial statistics keyed by (mtime, size); kept next to LOG_DIR so it is not counted as a task
+STATS_CACHE_PATH = os.path.join(LOG_DIR, '..', '.task_stats_cache.json')
 
 
 class TaskStatistics:
@@ -37,84 +48,186 @@ class TaskStatistics:
         if not os.path.exists(LOG_DIR):
             return stats
         
-        task_files = [f for f in os.listdir(LOG_DIR) if f.endswith('.json')]
-        stats["total_tasks"] = len(task_files)
+        # scandir yields the file type with each entry, no extra stat per file
+        with os.scandir(LOG_DIR) as it:
+            task_entries = [entry for entry in it if entry.name.endswith('.json') and entry.is_file()]
+        stats["total_tasks"] = len(task_entries)
         
         if stats["total_tasks"] == 0:
             return stats
         
-        processing_times = []
-        blur_scores = []
-        brightness_scores = []
-        contrast_scores = []
-        quality_scores = []
-        confidences = []
+        # Only logs that are new or changed since the last run are parsed again
+        cache = TaskStatistics._load_cache()
+        fingerprints = []
+        for entry in task_entries:
+            entry_stat = entry.stat()
+            fingerprints.append([entry_stat.st_mtime_ns, entry_stat.st_size])
+        stale = [
+            i for i, entry in enumerate(task_entries)
+            if entry.name not in cache or cache[entry.name][0] != fingerprints[i]
+        ]
+        
+        # Parse files in parallel (file reads and orjson release the GIL), then reduce in order
+        fresh = {}
+        if stale:
+            with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+                fresh = dict(zip(stale, executor.map(
+                    TaskStatistics._read_task_stats, [task_entries[i].path for i in stale]
+                )))
+        partials = [
+            fresh[i] if i in fresh else cache[entry.name][1]
+            for i, entry in enumerate(task_entries)
+        ]
+        
+        # Deleted logs drop out because only current files are written back
+        if stale or len(cache) != len(task_entries):
+            TaskStatistics._save_cache({
+                entry.name: [fingerprint, partial]
+                for entry, fingerprint, partial in zip(task_entries, fingerprints, partials)
+            })
+        
+        processing_time_sum, processing_time_count = 0, 0
+        blur_sum = brightness_sum = contrast_sum = quality_sum = 0
+        image_info_count = 0
+        confidence_sum, confidence_count = 0, 0
+        card_types = Counter()
         
-        for filename in task_files:
-            try:
-                with open(os.path.join(LOG_DIR, filename), 'r', encoding='utf-8') as f:
-                    task_data = json.load(f)
-                
-                # Count status
-                if task_data.get("status") == "completed":
-                    stats["completed_tasks"] += 1
-                else:
-                    stats["failed_tasks"] += 1
-                
-                result = task_data.get("result", {})
-                
-                # Processing time
-                if "timing" in result:
-                    processing_times.append(result["timing"].get("total_elapsed_time", 0))
-                elif "elapsed_time" in result:
-                    processing_times.append(result.get("elapsed_time", 0))
-                
-                # Image quality stats
-                if "image_info" in result:
-                    img_info = result["image_info"]
-                    blur_scores.append(img_info.get("blur_score", 0))
-                    brightness_scores.append(img_info.get("brightness", 0))
-                    contrast_scores.append(img_info.get("contrast", 0))
-                    quality_scores.append(img_info.get("quality_score", 0))
-                
-                # Card detection stats
-                if "details" in result:
-                    for detail in result["details"]:
-                        if "card_info" in detail and "detections" in detail["card_info"]:
-                            for detection in detail["card_info"]["detections"]:
-                                label = detection.get("detected_label", "unknown")
-                                stats["card_types"][label] = stats["card_types"].get(label, 0) + 1
-                                stats["total_cards_detected"] += 1
-                                
-                                conf = detection.get("confidence", 0)
-                                confidences.append(conf)
-                                stats["detection_confidence"]["min"] = min(stats["detection_confidence"]["min"], conf)
-                                stats["detection_confidence"]["max"] = max(stats["detection_confidence"]["max"], conf)
-                
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
+        for partial in partials:
+            if partial is None:
+                continue
+            stats["completed_tasks"] += partial["completed"]
+            stats["failed_tasks"] += 1 - partial["completed"]
+            processing_time_sum += partial["processing_time_sum"]
+            processing_time_count += partial["processing_time_count"]
+            blur_sum += partial["blur_sum"]
+            brightness_sum += partial["brightness_sum"]
+            contrast_sum += partial["contrast_sum"]
+            quality_sum += partial["quality_sum"]
+            image_info_count += partial["image_info_count"]
+            card_types.update(partial["card_types"])
+            stats["total_cards_detected"] += partial["confidence_count"]
+            confidence_sum += partial["confidence_sum"]
+            confidence_count += partial["confidence_count"]
+        
+        stats["card_types"] = dict(card_types)
+        
+        with_confidences = [partial for partial in partials if partial is not None and partial["confidence_count"]]
+        if with_confidences:
+            stats["detection_confidence"]["min"] = min(stats["detection_confidence"]["min"],
+                                                       min(partial["confidence_min"] for partial in with_confidences))
+            stats["detection_confidence"]["max"] = max(stats["detection_confidence"]["max"],
+                                                       max(partial["confidence_max"] for partial in with_confidences))
         
         # Calculate averages
-        if processing_times:
-            stats["average_processing_time"] = round(sum(processing_times) / len(processing_times), 3)
-            stats["total_processing_time"] = round(sum(processing_times), 3)
+        if processing_time_count:
+            stats["average_processing_time"] = round(processing_time_sum / processing_time_count, 3)
+            stats["total_processing_time"] = round(processing_time_sum, 3)
         
-        if blur_scores:
-            stats["image_quality_stats"]["average_blur_score"] = round(sum(blur_scores) / len(blur_scores), 2)
-        if brightness_scores:
-            stats["image_quality_stats"]["average_brightness"] = round(sum(brightness_scores) / len(brightness_scores), 2)
-        if contrast_scores:
-            stats["image_quality_stats"]["average_contrast"] = round(sum(contrast_scores) / len(contrast_scores), 2)
-        if quality_scores:
-            stats["image_quality_stats"]["average_quality_score"] = round(sum(quality_scores) / len(quality_scores), 2)
+        if image_info_count:
+            stats["image_quality_stats"]["average_blur_score"] = round(blur_sum / image_info_count, 2)
+            stats["image_quality_stats"]["average_brightness"] = round(brightness_sum / image_info_count, 2)
+            stats["image_quality_stats"]["average_contrast"] = round(contrast_sum / image_info_count, 2)
+            stats["image_quality_stats"]["average_quality_score"] = round(quality_sum / image_info_count, 2)
         
-        if confidences:
-            stats["detection_confidence"]["average"] = round(sum(confidences) / len(confidences), 4)
+        if confidence_count:
+            stats["detection_confidence"]["average"] = round(confidence_sum / confidence_count, 4)
         else:
             stats["detection_confidence"]["min"] = 0
         
         return stats
     
+    @staticmethod
+    def _load_cache():
+        """{filename: [[mtime_ns, size], partial]} from the last run, or {} if missing/corrupt"""
+        try:
+            with open(STATS_CACHE_PATH, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        for _, partial in cache.values():
+            if partial is not None:
+                partial["card_types"] = Counter(partial["card_types"])
+        return cache
+    
+    @staticmethod
+    def _save_cache(cache):
+        """Write the cache atomically (stdlib json keeps the Infinity confidence_min)"""
+        tmp_path = f"{STATS_CACHE_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, STATS_CACHE_PATH)
+        except OSError as e:
+            print(f"Error saving statistics cache: {e}")
+    
+    @staticmethod
+    def _read_task_stats(path):
+        """Partial statistics for one task log, or None if it cannot be read"""
+        partial = {
+            "completed": 0,
+            "processing_time_sum": 0,
+            "processing_time_count": 0,
+            "blur_sum": 0,
+            "brightness_sum": 0,
+            "contrast_sum": 0,
+            "quality_sum": 0,
+            "image_info_count": 0,
+            "card_types": Counter(),
+            "confidence_sum": 0,
+            "confidence_count": 0,
+            "confidence_min": float('inf'),
+            "confidence_max": 0
+        }
+        try:
+            with open(path, 'rb') as f:
+                task_data = _json_loads(f.read())
+            
+            # Count status
+            if task_data.get("status") == "completed":
+                partial["completed"] = 1
+            
+            result = task_data.get("result", {})
+            
+            # Processing time
+            if "timing" in result:
+                partial["processing_time_sum"] = result["timing"].get("total_elapsed_time", 0)
+                partial["processing_time_count"] = 1
+            elif "elapsed_time" in result:
+                partial["processing_time_sum"] = result.get("elapsed_time", 0)
+                partial["processing_time_count"] = 1
+            
+            # Image quality stats
+            if "image_info" in result:
+                img_info = result["image_info"]
+                partial["blur_sum"] = img_info.get("blur_score", 0)
+                partial["brightness_sum"] = img_info.get("brightness", 0)
+                partial["contrast_sum"] = img_info.get("contrast", 0)
+                partial["quality_sum"] = img_info.get("quality_score", 0)
+                partial["image_info_count"] = 1
+            
+            # Card detection stats
+            if "details" in result:
+                detections = [
+                    detection
+                    for detail in result["details"]
+                    if "card_info" in detail and "detections" in detail["card_info"]
+                    for detection in detail["card_info"]["detections"]
+                ]
+                if detections:
+                    partial["card_types"].update(detection.get("detected_label", "unknown") for detection in detections)
+                    
+                    # One C-level reduction each instead of a min()/max() call per detection
+                    confidences = [detection.get("confidence", 0) for detection in detections]
+                    partial["confidence_sum"] = sum(confidences)
+                    partial["confidence_count"] = len(confidences)
+                    partial["confidence_min"] = min(confidences)
+                    partial["confidence_max"] = max(confidences)
+            
+            return partial
+        except Exception as e:
+            print(f"Error processing {os.path.basename(path)}: {e}")
+            return None
+    
 if __name__ == "__main__":
     stats = TaskStatistics.get_statistics()
     print(json.dumps(stats, indent=4))
\ No newline at end of file
@@ -5,6 +5,7 @@ Automatically updates daily statistics at scheduled times
 import logging
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.combining import OrTrigger
 from apscheduler.triggers.cron import CronTrigger
 from service.statistics.TaskStatistics import TaskStatistics, save_daily_statistics
 
@@ -70,44 +71,37 @@ class StatisticsScheduler:
             return
         
         try:
-            # Schedule 1: Update daily statistics at midnight (00:00)
+            # One coalesced job: every 6 hours (00:00 included) and at end of business day (23:55).
+            # Missed fires collapse into a single run instead of stampeding.
             self.scheduler.add_job(
                 self.update_daily_statistics,
-                trigger=CronTrigger(hour=0, minute=0),
-                id='daily_stats_midnight',
-                name='Daily Statistics Update (Midnight)',
+                trigger=OrTrigger([
+                    CronTrigger(hour='*/6'),
+                    CronTrigger(hour=23, minute=55)
+                ]),
+                id='daily_stats',
+                name='Daily Statistics Update',
+                coalesce=True,
+                max_instances=1,
+                misfire_grace_time=300,
                 replace_existing=True
             )
-            logger.info("✓ Scheduled: Daily statistics update at 00:00 (midnight)")
+            logger.info("✓ Scheduled: Daily statistics update every 6 hours and at 23:55 (end of day)")
             
-            # Schedule 2: Update statistics every 6 hours
+            # Initial update runs on the scheduler thread so startup is not blocked by the log scan
             self.scheduler.add_job(
                 self.update_daily_statistics,
-                trigger=CronTrigger(hour='*/6'),
-                id='daily_stats_6hours',
-                name='Daily Statistics Update (Every 6 hours)',
+                trigger='date',
+                run_date=datetime.now() + timedelta(seconds=5),
+                id='daily_stats_initial',
+                name='Initial Statistics Update',
                 replace_existing=True
             )
-            logger.info("✓ Scheduled: Daily statistics update every 6 hours")
-            
-            # Schedule 3: Update at end of business day (23:55)
-            self.scheduler.add_job(
-                self.update_daily_statistics,
-                trigger=CronTrigger(hour=23, minute=55),
-                id='daily_stats_eod',
-                name='Daily Statistics Update (End of Day)',
-                replace_existing=True
-            )
-            logger.info("✓ Scheduled: Daily statistics update at 23:55 (end of day)")
             
             # Start the scheduler
             self.scheduler.start()
             self.is_running = True
             
-            # Run initial update
-            logger.info("Running initial statistics update...")
-            self.update_daily_statistics()
-            
             logger.info("✓ Statistics Scheduler started successfully!")
             logger.info(f"  - Next midnight update: {datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)}")
             
@@ -10,6 +10,21 @@ from typing import Tuple, Optional, Union
 import tempfile
 import os
 
+# JPEGs are DCT-downscaled by libjpeg during decode only while both sides stay at least this large
+JPEG_DRAFT_SIZE = (4096, 4096)
+
+
+def jpeg_draft_factor(size: Tuple[int, int], min_size: Tuple[int, int] = JPEG_DRAFT_SIZE) -> int:
+    """
+    Largest libjpeg DCT scale denominator (1, 2, 4 or 8) keeping a (width, height)
+    image at least min_size on both sides; the rule PIL's Image.draft applies
+    """
+    scale = min(size[0] // min_size[0], size[1] // min_size[1])
+    for factor in (8, 4, 2):
+        if scale >= factor:
+            return factor
+    return 1
+
 
 class ImageUploadHandler:
     """
@@ -18,6 +33,10 @@ class ImageUploadHandler:
     
     SUPPORTED_FORMATS = ['JPEG', 'JPG', 'PNG', 'BMP', 'WEBP', 'TIFF']
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+    # Pixel budget checked from the header before decoding (a small PNG can inflate to hundreds of MP)
+    MAX_IMAGE_PIXELS = 50_000_000
+    # Magic bytes of formats cv2.imdecode handles directly (libjpeg-turbo / libpng)
+    CV2_FAST_SIGNATURES = (b'\xff\xd8', b'\x89PNG')
     
     def __init__(self, auto_convert_to_rgb: bool = True):
         """
@@ -40,16 +59,13 @@ class ImageUploadHandler:
             PIL Image in RGB mode
         """
         if image.mode == 'RGBA':
-            # Create white background
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            # Paste image using alpha channel as mask
-            background.paste(image, mask=image.split()[3])  # 3 is the alpha channel
-            return background
+            # Composite onto white background using the alpha channel (3)
+            pixels = np.asarray(image)
+            return Image.fromarray(ImageUploadHandler._blend_on_white(pixels[..., :3], pixels[..., 3:4]))
         elif image.mode == 'LA':
             # Grayscale with alpha
-            background = Image.new('L', image.size, 255)
-            background.paste(image, mask=image.split()[1])
-            return background.convert('RGB')
+            pixels = np.asarray(image)
+            return Image.fromarray(ImageUploadHandler._blend_on_white(pixels[..., 0], pixels[..., 1])).convert('RGB')
         elif image.mode == 'P':
             # Palette mode
             return image.convert('RGB')
@@ -65,6 +81,18 @@ class ImageUploadHandler:
         
         return image
     
+    @staticmethod
+    def _blend_on_white(color: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+        """
+        color * alpha + 255 * (255 - alpha), divided by 255 with PIL's rounding
+        (same result as Image.paste with an alpha mask), in integer lanes
+        """
+        alpha = alpha.astype(np.uint32)
+        blended = color * alpha + 255 * (255 - alpha) + 128
+        blended += blended >> 8
+        blended >>= 8
+        return blended.astype(np.uint8)
+    
     def load_from_bytes(
         self, 
         image_bytes: bytes,
@@ -88,7 +116,7 @@ class ImageUploadHandler:
         if file_size > self.MAX_FILE_SIZE:
             raise ValueError(f"File size ({file_size} bytes) exceeds maximum ({self.MAX_FILE_SIZE} bytes)")
         
-        # Load image
+        # Load image (Image.open only parses the header, pixels are decoded lazily)
         try:
             image = Image.open(io.BytesIO(image_bytes))
         except Exception as e:
@@ -97,7 +125,18 @@ class ImageUploadHandler:
         # Get original info
         original_mode = image.mode
         original_format = image.format or "UNKNOWN"
+        
+        # Huge JPEGs: let libjpeg decode at 1/2, 1/4 or 1/8 scale, never below JPEG_DRAFT_SIZE
+        downscaled = False
+        if original_format == 'JPEG':
+            factor = jpeg_draft_factor(image.size)
+            if factor > 1:
+                image.draft(original_mode, (image.size[0] // factor, image.size[1] // factor))
+                downscaled = True
+        
         width, height = image.size
+        if width * height > self.MAX_IMAGE_PIXELS:
+            raise ValueError(f"Image resolution ({width}x{height}) exceeds maximum ({self.MAX_IMAGE_PIXELS} pixels)")
         
         info = {
             "original_mode": original_mode,
@@ -105,7 +144,8 @@ class ImageUploadHandler:
             "width": width,
             "height": height,
             "file_size": file_size,
-            "converted": False
+            "converted": False,
+            "downscaled": downscaled
         }
         
         # Convert if needed
@@ -118,21 +158,47 @@ class ImageUploadHandler:
         
         return image, info
     
+    @staticmethod
+    def _save_kwargs(format: str, quality: Optional[int], lossless: bool, optimize_jpeg: bool = True) -> dict:
+        """
+        PIL save settings per format
+        
+        WEBP: quality 80, method 4 (libwebp default speed/size balance), ~25-35% smaller than JPEG;
+        JPEG: quality 95 (+ optimize unless optimize_jpeg=False)
+        """
+        fmt = format.upper()
+        save_kwargs = {}
+        if fmt in ['JPEG', 'JPG']:
+            save_kwargs['quality'] = quality if quality is not None else 95
+            if optimize_jpeg:
+                save_kwargs['optimize'] = True
+        elif fmt == 'WEBP':
+            if lossless:
+                save_kwargs['lossless'] = True
+            else:
+                save_kwargs['quality'] = quality if quality is not None else 80
+            save_kwargs['method'] = 4
+        elif fmt == 'PNG':
+            save_kwargs['optimize'] = True
+        return save_kwargs
+    
     def save_to_temp(
         self,
         image: Image.Image,
-        format: str = 'JPEG',
-        quality: int = 95,
-        suffix: Optional[str] = None
+        format: str = 'WEBP',
+        quality: Optional[int] = None,
+        suffix: Optional[str] = None,
+        lossless: bool = False
     ) -> str:
         """
         Save PIL Image to temporary file
         
         Args:
             image: PIL Image to save
-            format: Output format (JPEG, PNG, etc.)
-            quality: JPEG quality (1-100)
+            format: Output format (WEBP, JPEG, PNG, etc.)
+            quality: Lossy quality (1-100), defaults to 80 for WEBP and 95 for JPEG
             suffix: File suffix (auto-detected if None)
+            lossless: Lossless WEBP (logos / screen content)
             
         Returns:
             Path to temporary file
@@ -152,17 +218,53 @@ class ImageUploadHandler:
             temp_path = tmp_file.name
             
             # Save with appropriate settings
-            save_kwargs = {}
-            if format.upper() in ['JPEG', 'JPG']:
-                save_kwargs['quality'] = quality
-                save_kwargs['optimize'] = True
-            elif format.upper() == 'PNG':
-                save_kwargs['optimize'] = True
-            
-            image.save(temp_path, format=format, **save_kwargs)
+            image.save(temp_path, format=format, **self._save_kwargs(format, quality, lossless))
         
         return temp_path
     
+    def encode_to_bytes(
+        self,
+        image: Union[Image.Image, np.ndarray],
+        format: str = 'WEBP',
+        quality: Optional[int] = None,
+        lossless: bool = False
+    ) -> bytes:
+        """
+        Encode image in memory, same settings as save_to_temp without touching disk,
+        except JPEG skips optimize (extra Huffman pass, slower for a buffer that is decoded right away)
+        
+        Args:
+            image: PIL Image or OpenCV array (BGR format)
+            format: Output format (WEBP, JPEG, PNG, etc.)
+            quality: Lossy quality (1-100), defaults to 80 for WEBP and 95 for JPEG
+            lossless: Lossless WEBP (logos / screen content)
+            
+        Returns:
+            Encoded image bytes
+        """
+        if isinstance(image, np.ndarray):
+            save_kwargs = self._save_kwargs(format, quality, lossless)
+            fmt = format.upper()
+            if fmt in ['JPEG', 'JPG']:
+                ext, params = '.jpg', [cv2.IMWRITE_JPEG_QUALITY, save_kwargs['quality']]
+            elif fmt == 'WEBP':
+                # libwebp treats quality > 100 as lossless
+                ext, params = '.webp', [cv2.IMWRITE_WEBP_QUALITY, 101 if lossless else save_kwargs['quality']]
+            else:
+                ext, params = f'.{format.lower()}', []
+            ok, encoded = cv2.imencode(ext, image, params)
+            if not ok:
+                raise ValueError(f"Failed to encode image as {format}")
+            return encoded.tobytes()
+        
+        # Ensure RGB for JPEG
+        if format.upper() in ['JPEG', 'JPG'] and image.mode != 'RGB':
+            image = self.convert_to_rgb(image)
+        
+        buffer = io.BytesIO()
+        image.save(buffer, format=format, **self._save_kwargs(format, quality, lossless, optimize_jpeg=False))
+        return buffer.getvalue()
+    
     def to_cv2_array(self, image: Image.Image) -> np.ndarray:
         """
         Convert PIL Image to OpenCV array (BGR format)
@@ -177,14 +279,37 @@ class ImageUploadHandler:
         if image.mode != 'RGB':
             image = self.convert_to_rgb(image)
         
-        # Convert to numpy array
-        img_array = np.array(image)
+        # Read-only view of the buffer PIL exports, no extra copy like np.array
+        img_array = np.asarray(image)
         
-        # Convert RGB to BGR for OpenCV
+        # Convert RGB to BGR for OpenCV - cvtColor writes a new buffer, so the result is writable
         img_bgr = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
         
         return img_bgr
     
+    def load_cv2_from_bytes(self, image_bytes: bytes) -> np.ndarray:
+        """
+        Decode bytes straight to an OpenCV array (BGR format)
+        
+        Skips the PIL -> numpy -> cvtColor chain; falls back to PIL for
+        formats cv2.imdecode cannot read (multi-page TIFF, some WEBP variants)
+        
+        Args:
+            image_bytes: Raw image bytes
+            
+        Returns:
+            OpenCV array in BGR format
+        """
+        # Ignore EXIF orientation so pixels match what PIL's Image.open returns
+        img_bgr = cv2.imdecode(
+            np.frombuffer(image_bytes, np.uint8),
+            cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+        )
+        if img_bgr is None:
+            image, _ = self.load_from_bytes(image_bytes, convert_to_rgb=True)
+            img_bgr = self.to_cv2_array(image)
+        return img_bgr
+    
     def calculate_quality_metrics(self, image: Union[Image.Image, np.ndarray]) -> dict:
         """
         Calculate image quality metrics
@@ -208,9 +333,14 @@ class ImageUploadHandler:
             gray = img_array
         
         # Calculate metrics
-        blur_score = cv2.Laplacian(gray, cv2.CV_64F).var()
-        brightness = gray.mean()
-        contrast = gray.std()
+        # CV_16S holds any 3x3 Laplacian of 8-bit input exactly (1/4 the bytes of CV_64F);
+        # meanStdDev gives mean and std in one pass
+        if gray.dtype == np.uint8:
+            laplacian = cv2.Laplacian(gray, cv2.CV_16S)
+        else:
+            laplacian = cv2.Laplacian(gray, cv2.CV_64F)
+        blur_score = cv2.meanStdDev(laplacian)[1][0, 0] ** 2
+        brightness, contrast = (value[0, 0] for value in cv2.meanStdDev(gray))
         
         # Calculate overall quality score (0-100)
         quality_score = min(100, (blur_score / 5) + (contrast / 2))
@@ -226,8 +356,10 @@ class ImageUploadHandler:
         self,
         image_bytes: bytes,
         save_temp: bool = True,
-        format: str = 'JPEG',
-        calculate_metrics: bool = True
+        format: str = 'WEBP',
+        calculate_metrics: bool = True,
+        encode_bytes: bool = False,
+        lossless: bool = False
     ) -> dict:
         """
         Complete processing pipeline for uploaded image
@@ -235,8 +367,10 @@ class ImageUploadHandler:
         Args:
             image_bytes: Raw image bytes from upload
             save_temp: Whether to save to temporary file
-            format: Output format for temp file
-            calculate_metrics: Whether to calculate quality metrics
+            format: Output format for temp file / encoded bytes
+            calculate_metrics: Whether to calculate quality metrics (also provides "image_bgr")
+            encode_bytes: Whether to return the image re-encoded in memory as "encoded_bytes"
+            lossless: Lossless WEBP output
             
         Returns:
             Dictionary with all processing results
@@ -251,12 +385,24 @@ class ImageUploadHandler:
         
         # Save to temp file
         if save_temp:
-            temp_path = self.save_to_temp(image, format=format)
+            temp_path = self.save_to_temp(image, format=format, lossless=lossless)
             result["temp_path"] = temp_path
         
+        # In-memory encode for consumers that take bytes, no temp file round-trip
+        if encode_bytes:
+            result["encoded_bytes"] = self.encode_to_bytes(image, format=format, lossless=lossless)
+        
         # Calculate metrics
         if calculate_metrics:
-            metrics = self.calculate_quality_metrics(image)
+            # Plain RGB JPEG/PNG decode to the same pixels with cv2, no PIL round-trip needed;
+            # other modes (alpha, palette, CMYK) keep the PIL conversion rules
+            if (info["original_mode"] == 'RGB' and not info["downscaled"]
+                    and image_bytes.startswith(self.CV2_FAST_SIGNATURES)):
+                image_bgr = self.load_cv2_from_bytes(image_bytes)
+            else:
+                image_bgr = self.to_cv2_array(image)
+            result["image_bgr"] = image_bgr
+            metrics = self.calculate_quality_metrics(image_bgr)
             result["metrics"] = metrics
         
         return result
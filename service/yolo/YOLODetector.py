@@ -1,10 +1,28 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, astuple
 from typing import List, Dict, Optional, Union, Tuple
+import threading
+import importlib.util
+import json
+from concurrent.futures import Future, ThreadPoolExecutor
 import cv2
 import numpy as np
 import os
 
+# Detector dùng chung theo (class, model_path, config): mỗi model chỉ load một lần mỗi process.
+# Giá trị là Future của detector để lượt load (có thể gồm TensorRT export) chạy ngoài lock chung
+_shared_detectors = {}
+_shared_detectors_lock = threading.Lock()
+
+# Load + resize ảnh của một batch chạy song song (cv2.imread / cv2.resize nhả GIL)
+_PREPROCESS_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="yolo-preprocess")
+
+# CLAHE giữ buffer nội bộ nên không dùng chung giữa các thread: mỗi thread (preprocess pool) một instance
+_clahe_local = threading.local()
+
+# Batch tối đa của TensorRT engine (dynamic batch 1..N), bằng batch_size mặc định của detect_batch
+TRT_MAX_BATCH = 16
+
 @dataclass
 class DetectionConfig:
     """Configuration cho detection"""
@@ -13,6 +31,9 @@ class DetectionConfig:
     max_positions_per_label: int = 2  # Số vị trí tốt nhất cho mỗi label
     target_size: int = 640
     enhance_image: bool = False
+    cuda_preprocess: bool = True  # Letterbox trên GPU khi có CUDA, bỏ qua cv2.resize trên CPU
+    fast_nms: bool = False  # Fast NMS (box đã bị loại vẫn có thể loại box khác) thay cho NMS tuần tự
+    tensorrt: bool = False  # Export .pt sang TensorRT FP16 (cache cạnh file .pt) khi có CUDA + tensorrt
     
 @dataclass 
 class Detection:
@@ -52,27 +73,35 @@ class ImageProcessor:
         new_w = int(w * scale)
         new_h = int(h * scale)
         
-        # Resize
-        resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
-        
-        # Tạo canvas và center image
-        canvas = np.zeros((target_size, target_size, 3), dtype=np.uint8)
+        # Tạo canvas (không zero-fill toàn bộ) và chỉ tô đen phần padding quanh vùng ảnh
+        canvas = np.empty((target_size, target_size, 3), dtype=np.uint8)
         pad_w = (target_size - new_w) // 2
         pad_h = (target_size - new_h) // 2
+        canvas[:pad_h] = 0
+        canvas[pad_h+new_h:] = 0
+        canvas[pad_h:pad_h+new_h, :pad_w] = 0
+        canvas[pad_h:pad_h+new_h, pad_w+new_w:] = 0
         
-        canvas[pad_h:pad_h+new_h, pad_w:pad_w+new_w] = resized
+        # Resize thẳng vào vùng giữa canvas, không qua ảnh trung gian.
+        # Giữ INTER_LINEAR cả khi thu nhỏ: giống letterbox lúc train của ultralytics, và INTER_AREA với
+        # tỷ lệ không nguyên chậm hơn nhiều (~45ms so với ~1ms cho ảnh 4000x3000 -> 640)
+        cv2.resize(image, (new_w, new_h), dst=canvas[pad_h:pad_h+new_h, pad_w:pad_w+new_w],
+                   interpolation=cv2.INTER_LINEAR)
         
         return canvas, scale, (pad_w, pad_h)
     
     @staticmethod
     def enhance_image(image: np.ndarray) -> np.ndarray:
         """Apply enhancement pipeline"""
+        clahe = getattr(_clahe_local, "clahe", None)
+        if clahe is None:
+            clahe = _clahe_local.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        
+        # Chỉ kênh L thay đổi: CLAHE trên L rồi ghi đè lại vào lab, a/b không split/merge
         lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        l_enhanced = clahe.apply(l)
-        enhanced = cv2.merge([l_enhanced, a, b])
-        enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
+        l_enhanced = clahe.apply(cv2.extractChannel(lab, 0))
+        cv2.insertChannel(l_enhanced, lab, 0)
+        enhanced = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
         return enhanced
 
 class DetectionFilter:
@@ -99,10 +128,22 @@ class DetectionFilter:
         
         return intersection / union if union > 0 else 0.0
     
+    @staticmethod
+    def _iou_matrix(boxes: np.ndarray) -> np.ndarray:
+        """IoU từng cặp của N boxes (N, 4) [x1, y1, x2, y2] -> ma trận (N, N), cùng quy ước với calculate_iou"""
+        boxes = boxes.astype(np.float64)
+        tl = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+        br = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+        inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+        area = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+        union = area[:, None] + area[None, :] - inter
+        return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+    
     @classmethod
     def filter_multi_position(cls, detections: List[Detection], 
                              max_per_label: int = 2,
-                             iou_threshold: float = 0.5) -> List[Detection]:
+                             iou_threshold: float = 0.5,
+                             fast_nms: bool = False) -> List[Detection]:
         """
         Lọc để lấy nhiều vị trí tốt nhất cho mỗi label
         
@@ -110,6 +151,8 @@ class DetectionFilter:
             detections: Danh sách detections
             max_per_label: Số vị trí tối đa cho mỗi label
             iou_threshold: Ngưỡng IoU để coi là trùng vị trí
+            fast_nms: Fast NMS (YOLACT) - giữ box không bị box nào có confidence cao hơn trùng,
+                      kể cả box đã bị loại; nhanh hơn với nhiều box nhưng có thể loại nhiều hơn
         
         Returns:
             Danh sách detections đã lọc với position_rank
@@ -130,24 +173,39 @@ class DetectionFilter:
             # Sắp xếp theo confidence giảm dần
             class_dets.sort(key=lambda x: x.confidence, reverse=True)
             
+            # Detection đầu tiên luôn được giữ nên 1 vị trí thì không cần tính IoU
+            if max_per_label == 1:
+                class_dets[0].position_rank = 0
+                final_detections.append(class_dets[0])
+                continue
+            
+            # IoU của mọi cặp trong class tính một lần
+            iou = cls._iou_matrix(np.array([det.bbox for det in class_dets]).reshape(-1, 4))
+            
+            if fast_nms:
+                # IoU lớn nhất với các box đứng trước (confidence cao hơn) theo từng cột
+                max_iou = np.triu(iou, k=1).max(axis=0)
+                keep = np.flatnonzero(max_iou <= iou_threshold)[:max_per_label]
+                for rank, i in enumerate(keep):
+                    class_dets[i].position_rank = rank
+                final_detections.extend(class_dets[i] for i in keep)
+                continue
+            
             selected = []
-            for det in class_dets:
+            selected_idx = []
+            for i, det in enumerate(class_dets):
                 # Kiểm tra xem detection này có trùng với các detection đã chọn không
-                is_duplicate = False
-                for sel_det in selected:
-                    iou = cls.calculate_iou(det.bbox, sel_det.bbox)
-                    if iou > iou_threshold:
-                        is_duplicate = True
-                        break
+                if selected_idx and (iou[i, selected_idx] > iou_threshold).any():
+                    continue
+                
+                # Gán position rank
+                det.position_rank = len(selected)
+                selected.append(det)
+                selected_idx.append(i)
                 
-                if not is_duplicate:
-                    # Gán position rank
-                    det.position_rank = len(selected)
-                    selected.append(det)
-                    
-                    # Dừng khi đủ số lượng
-                    if len(selected) >= max_per_label:
-                        break
+                # Dừng khi đủ số lượng
+                if len(selected) >= max_per_label:
+                    break
             
             final_detections.extend(selected)
         
@@ -166,20 +224,189 @@ class YOLODetector(ABC):
         self.model = self._load_model(model_path)
         self.image_processor = ImageProcessor()
         self.filter = DetectionFilter()
+        self.preprocess_device = self._select_preprocess_device()
+        # Predictor của ultralytics giữ state, không an toàn khi gọi song song trên cùng model
+        self._predict_lock = threading.Lock()
         print(f"✓ Initialized YOLODetector")
         print(f"  - Config: conf={self.config.conf_threshold}, max_pos={self.config.max_positions_per_label}")
     
+    @classmethod
+    def get_shared(cls, model_path: str, config: DetectionConfig = None) -> "YOLODetector":
+        """
+        Trả về detector dùng chung cho (model_path, config), load và warm-up ở lần gọi đầu
+        
+        Tránh giữ nhiều bản weights trong VRAM khi nhiều service cùng dùng một model
+        """
+        config = config or DetectionConfig()
+        key = (cls, model_path, astuple(config))
+        with _shared_detectors_lock:
+            entry = _shared_detectors.get(key)
+            is_loader = entry is None
+            if is_loader:
+                entry = _shared_detectors[key] = Future()
+        
+        # Chỉ lock theo key: request của model khác không phải chờ lượt load này
+        if is_loader:
+            try:
+                detector = cls(model_path, config)
+                detector.warmup()
+            except BaseException as e:
+                with _shared_detectors_lock:
+                    _shared_detectors.pop(key, None)
+                entry.set_exception(e)
+                raise
+            entry.set_result(detector)
+        return entry.result()
+    
     def _load_model(self, model_path: str):
-        """Load YOLO model"""
+        """Load YOLO model (TensorRT engine thay cho .pt nếu bật và môi trường hỗ trợ)"""
         try:
             from ultralytics import YOLO
             model = YOLO(model_path)
+            if self._use_tensorrt(model_path):
+                try:
+                    engine_path = self._tensorrt_engine(model, model_path)
+                    model = YOLO(engine_path, task=model.task)
+                    model_path = engine_path
+                except Exception as e:
+                    print(f"⚠️ TensorRT export failed, using PyTorch model: {e}")
             print(f"✓ Loaded model: {model_path}")
             print(f"  - Classes: {list(model.names.values())}")
             return model
         except Exception as e:
             raise RuntimeError(f"Failed to load model: {e}")
     
+    def _use_tensorrt(self, model_path: str) -> bool:
+        """Chỉ export khi bật tensorrt, model là .pt, có GPU và đã cài tensorrt"""
+        if not self.config.tensorrt or not model_path.endswith('.pt'):
+            return False
+        if importlib.util.find_spec('tensorrt') is None:
+            return False
+        try:
+            import torch
+            return torch.cuda.is_available()
+        except ImportError:
+            return False
+    
+    def _tensorrt_engine(self, model, model_path: str) -> str:
+        """
+        Đường dẫn TensorRT FP16 engine của model, build lần đầu (mất khoảng 1 phút) rồi dùng lại
+        
+        Engine theo (imgsz, batch, fp16) được ghi trong sidecar <model>.engine.json cạnh file .pt.
+        Build được khoá bằng file lock nên nhiều process (uvicorn workers) khởi động cùng lúc chỉ build một lần
+        """
+        from filelock import FileLock  # đi kèm torch
+        
+        stem = os.path.splitext(model_path)[0]
+        sidecar_path = f"{stem}.engine.json"
+        key = f"imgsz={self.config.target_size},batch={TRT_MAX_BATCH},fp16=True"
+        
+        engine_path = self._read_engine_sidecar(sidecar_path).get(key)
+        if engine_path and os.path.exists(engine_path):
+            return engine_path
+        
+        with FileLock(f"{stem}.engine.lock"):
+            # Process khác có thể vừa build xong trong lúc chờ lock
+            engines = self._read_engine_sidecar(sidecar_path)
+            engine_path = engines.get(key)
+            if engine_path and os.path.exists(engine_path):
+                return engine_path
+            
+            # export ghi ONNX trung gian <stem>.onnx trước khi build engine; chỉ xoá nếu do lần export này tạo ra
+            onnx_path = f"{stem}.onnx"
+            onnx_existed = os.path.exists(onnx_path)
+            print(f"⏳ Exporting TensorRT FP16 engine ({key}): {model_path}")
+            try:
+                exported = model.export(
+                    format="engine",
+                    half=True,
+                    dynamic=True,
+                    batch=TRT_MAX_BATCH,
+                    imgsz=self.config.target_size,
+                    workspace=4,
+                    verbose=False
+                )
+            finally:
+                if not onnx_existed and os.path.exists(onnx_path):
+                    os.remove(onnx_path)
+            # export luôn ghi ra <stem>.engine: đổi tên theo key để các cấu hình khác nhau không ghi đè nhau
+            engine_path = f"{stem}_{self.config.target_size}_b{TRT_MAX_BATCH}_fp16.engine"
+            os.replace(exported, engine_path)
+            
+            # Ghi sidecar qua file tạm + os.replace để process khác không đọc phải file đang ghi dở
+            engines[key] = engine_path
+            tmp_path = f"{sidecar_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(engines, f, indent=2)
+            os.replace(tmp_path, sidecar_path)
+        return engine_path
+    
+    @staticmethod
+    def _read_engine_sidecar(sidecar_path: str) -> dict:
+        """Nội dung sidecar engine, {} nếu chưa có hoặc không đọc được"""
+        try:
+            with open(sidecar_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _select_preprocess_device(self):
+        """Trả về torch.device('cuda') nếu bật cuda_preprocess và có GPU, ngược lại None (dùng OpenCV)"""
+        if not self.config.cuda_preprocess:
+            return None
+        try:
+            import torch
+            return torch.device('cuda') if torch.cuda.is_available() else None
+        except ImportError:
+            return None
+    
+    def preprocess_cuda(self, image: np.ndarray, device=None):
+        """
+        Letterbox + BGR→RGB + /255 + HWC→CHW trên device trong một lượt:
+        ảnh uint8 chỉ upload một lần, mọi bước sau chạy trên GPU
+        
+        Returns: (tensor 1x3xSxS float 0-1 RGB, scale_factor, (pad_w, pad_h))
+        """
+        import torch
+        import torch.nn.functional as F
+        
+        device = device or self.preprocess_device or torch.device('cuda')
+        target_size = self.config.target_size
+        h, w = image.shape[:2]
+        
+        # Cùng công thức scale / padding với ImageProcessor.smart_resize
+        scale = min(target_size / w, target_size / h)
+        new_w = int(w * scale)
+        new_h = int(h * scale)
+        pad_w = (target_size - new_w) // 2
+        pad_h = (target_size - new_h) // 2
+        
+        src = torch.from_numpy(np.ascontiguousarray(image)).to(device, non_blocking=True)
+        src = src.permute(2, 0, 1).flip(0).unsqueeze(0).float()  # HWC BGR -> 1xCHW RGB
+        resized = F.interpolate(src, size=(new_h, new_w), mode='bilinear', align_corners=False)
+        
+        canvas = src.new_zeros((1, 3, target_size, target_size))
+        canvas[..., pad_h:pad_h + new_h, pad_w:pad_w + new_w] = resized.round_().clamp_(0, 255).div_(255)
+        
+        return canvas, scale, (pad_w, pad_h)
+    
+    def warmup(self, runs: int = 2):
+        """
+        Chạy vài inference giả trên ảnh đen để load weights lên device, khởi tạo
+        predictor / cuDNN trước request thật đầu tiên
+        """
+        dummy = np.zeros((self.config.target_size, self.config.target_size, 3), dtype=np.uint8)
+        try:
+            with self._predict_lock:
+                for _ in range(runs):
+                    self.model.predict(dummy, conf=self.config.conf_threshold,
+                                       iou=self.config.iou_threshold, verbose=False)
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+        except Exception as e:
+            print(f"⚠️ YOLO warm-up failed: {e}")
+    
     def count_detections_by_class(self, detections: List[Detection]) -> Dict[str, int]:
         """
         Đếm số lượng detection theo từng class
@@ -236,6 +463,74 @@ class YOLODetector(ABC):
         Returns:
             List of Detection objects
         """
+        processed_img, scale, padding, original_shape = self._preprocess(image)
+        
+        # Run inference
+        with self._predict_lock:
+            results = self.model.predict(
+                processed_img,
+                conf=self.config.conf_threshold,
+                iou=self.config.iou_threshold,
+                verbose=False
+            )
+        
+        # Parse results
+        detections = self._parse_results(results, scale, padding, original_shape)
+        
+        return self._apply_filter(detections, filter_mode)
+    
+    def detect_batch(self, images: List[Union[str, np.ndarray]],
+                     filter_mode: int = 0,
+                     batch_size: int = TRT_MAX_BATCH) -> List[List[Detection]]:
+        """
+        Phát hiện objects trên nhiều ảnh, mỗi lần inference một batch
+        
+        Args:
+            images: List đường dẫn ảnh hoặc numpy array
+            filter_mode: Giống detect()
+            batch_size: Số ảnh tối đa mỗi lần model.predict
+        
+        Returns:
+            List of Detection lists, cùng thứ tự với images
+        """
+        all_detections = []
+        for start in range(0, len(images), batch_size):
+            all_detections.extend(self._detect_chunk(images[start:start + batch_size], filter_mode))
+        return all_detections
+    
+    def _detect_chunk(self, images: List[Union[str, np.ndarray]], filter_mode: int) -> List[List[Detection]]:
+        """Một lần model.predict cho cả list ảnh"""
+        # smart_resize pad mọi ảnh về target_size x target_size nên có thể stack thành 1 batch
+        if len(images) > 1:
+            prepared = list(_PREPROCESS_EXECUTOR.map(self._preprocess, images))
+        else:
+            prepared = [self._preprocess(image) for image in images]
+        batch = [processed_img for processed_img, _, _, _ in prepared]
+        if self.preprocess_device is not None:
+            import torch
+            batch = torch.cat(batch)
+        with self._predict_lock:
+            results = self.model.predict(
+                batch,
+                conf=self.config.conf_threshold,
+                iou=self.config.iou_threshold,
+                verbose=False
+            )
+        
+        return [
+            self._apply_filter(
+                self._parse_results([result], scale, padding, original_shape),
+                filter_mode
+            )
+            for result, (_, scale, padding, original_shape) in zip(results, prepared)
+        ]
+    
+    def _preprocess(self, image: Union[str, np.ndarray]) -> Tuple[np.ndarray, float, Tuple[int, int], Tuple[int, int]]:
+        """
+        Load, enhance và resize ảnh. Returns: (processed_img, scale, (pad_w, pad_h), (orig_h, orig_w))
+        
+        processed_img là tensor 1x3xSxS trên GPU khi preprocess_device được bật, ngược lại là ảnh BGR uint8
+        """
         # Load ảnh
         if isinstance(image, str):
             img_array = cv2.imread(image)
@@ -251,24 +546,17 @@ class YOLODetector(ABC):
             img_array = self.image_processor.enhance_image(img_array)
         
         # Resize ảnh
-        processed_img, scale, (pad_w, pad_h) = self.image_processor.smart_resize(
-            img_array, self.config.target_size
-        )
-        
-        # Run inference
-        results = self.model.predict(
-            processed_img,
-            conf=self.config.conf_threshold,
-            iou=self.config.iou_threshold,
-            verbose=False
-        )
-        
-        # Parse results
-        detections = self._parse_results(
-            results, scale, (pad_w, pad_h), (original_h, original_w)
-        )
+        if self.preprocess_device is not None:
+            processed_img, scale, (pad_w, pad_h) = self.preprocess_cuda(img_array)
+        else:
+            processed_img, scale, (pad_w, pad_h) = self.image_processor.smart_resize(
+                img_array, self.config.target_size
+            )
         
-        # Apply filter dựa theo filter_mode
+        return processed_img, scale, (pad_w, pad_h), (original_h, original_w)
+    
+    def _apply_filter(self, detections: List[Detection], filter_mode: int) -> List[Detection]:
+        """Apply filter dựa theo filter_mode và sort kết quả"""
         if filter_mode == 0:
             # No filter
             filtered_detections = self.filter.no_filter(detections)
@@ -277,7 +565,8 @@ class YOLODetector(ABC):
             filtered_detections = self.filter.filter_multi_position(
                 detections,
                 max_per_label=self.config.max_positions_per_label,
-                iou_threshold=self.config.iou_threshold
+                iou_threshold=self.config.iou_threshold,
+                fast_nms=self.config.fast_nms
             )
         else:
             raise ValueError(f"Invalid filter_mode: {filter_mode}. Use 0 or 1.")
@@ -298,38 +587,27 @@ class YOLODetector(ABC):
             if result.boxes is None or len(result.boxes) == 0:
                 continue
                 
-            for box in result.boxes:
-                # Extract data
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                confidence = float(box.conf[0].cpu().numpy())
-                class_id = int(box.cls[0].cpu().numpy())
-                class_name = self.model.names[class_id]
-                
-                # Convert về tọa độ ảnh gốc
-                # Bước 1: Bỏ padding
-                x1 = x1 - pad_w
-                y1 = y1 - pad_h
-                x2 = x2 - pad_w
-                y2 = y2 - pad_h
-                
-                # Bước 2: Scale về kích thước gốc
-                x1 = int(x1 / scale)
-                y1 = int(y1 / scale)
-                x2 = int(x2 / scale)
-                y2 = int(y2 / scale)
-                
-                # Clamp về bounds ảnh gốc
-                x1 = max(0, min(x1, orig_w))
-                y1 = max(0, min(y1, orig_h))
-                x2 = max(0, min(x2, orig_w))
-                y2 = max(0, min(y2, orig_h))
-                
+            boxes = result.boxes
+            # Lọc theo confidence trên device, chỉ copy phần còn lại về CPU một lần
+            keep = boxes.conf >= self.config.conf_threshold
+            xyxy = boxes.xyxy[keep].cpu().numpy()
+            confidences = boxes.conf[keep].cpu().numpy()
+            class_ids = boxes.cls[keep].cpu().numpy().astype(int)
+            
+            # Convert về tọa độ ảnh gốc
+            # Bước 1: Bỏ padding, Bước 2: Scale về kích thước gốc
+            coords = ((xyxy - (pad_w, pad_h, pad_w, pad_h)) / scale).astype(int)
+            
+            # Clamp về bounds ảnh gốc
+            np.clip(coords, 0, (orig_w, orig_h, orig_w, orig_h), out=coords)
+            
+            for (x1, y1, x2, y2), confidence, class_id in zip(coords.tolist(), confidences.tolist(), class_ids.tolist()):
                 # Skip boxes quá nhỏ
                 if (x2 - x1) < 5 or (y2 - y1) < 5:
                     continue
                 
                 detection = Detection(
-                    class_name=class_name,
+                    class_name=self.model.names[class_id],
                     class_id=class_id,
                     confidence=confidence,
                     bbox=[x1, y1, x2, y2]
@@ -403,11 +681,13 @@ if __name__ == "__main__":
     # Test trên thư mục ảnh
     image_dir = r"C:\Workspace\ORBAPI\images"
 
-    for fname in os.listdir(image_dir):
-        if not fname.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")):
-            continue
+    fnames = [fname for fname in os.listdir(image_dir)
+              if fname.lower().endswith((".jpg", ".jpeg", ".png", ".bmp"))]
+    all_detections = detector.detect_batch(
+        [os.path.join(image_dir, fname) for fname in fnames], filter_mode=1, batch_size=16
+    )
+    for fname, detections in zip(fnames, all_detections):
         img_path = os.path.join(image_dir, fname)
-        detections = detector.detect(img_path, filter_mode=1)
         
         # Đếm số lượng từng class
         class_counts = detector.count_detections_by_class(detections)
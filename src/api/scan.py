@@ -77,13 +77,13 @@ async def scan_card(image_file: UploadFile = File(...)):
         image_handler = ImageUploadHandler(auto_convert_to_rgb=True)
         upload_result = image_handler.process_upload(
             contents,
-            save_temp=True,
+            save_temp=False,  # Detector and OCR take the decoded array directly
             format='JPEG',
             calculate_metrics=True
         )
         
         image = upload_result['image']
-        temp_path = upload_result['temp_path']
+        image_bgr = upload_result['image_bgr']
         
         # Build image quality info
         image_quality = {
@@ -103,10 +103,10 @@ async def scan_card(image_file: UploadFile = File(...)):
         
         # Initialize detector with config
         pt_config = PtConfig()
-        cccd_detector = CCCDDetector(pt_config.get_model("CCCD_FACE_DETECT_2025_NEW_TITLE"), config)
+        cccd_detector = CCCDDetector.get_shared(pt_config.get_model("CCCD_FACE_DETECT_2025_NEW_TITLE"), config)
         
         # Detect card from the image
-        detection_result = cccd_detector.process_image(temp_path)
+        detection_result = cccd_detector.process_image(image_bgr)
         print(f"Detection result: {detection_result}")
         print(f"Task ID: {task_id}")
         
@@ -163,7 +163,7 @@ async def scan_card(image_file: UploadFile = File(...)):
             if detected_label in ['cccd_qr_front', 'cccd_qr_back']:
                 from service.card.OCR_CCCD_QR import OCR_CCCD_QR
                 ocr_processor = OCR_CCCD_QR(face=detected_label)
-                ocr_result = ocr_processor.process_image(temp_path)
+                ocr_result = ocr_processor.process_image(image_bgr)
                 
                 # Map OCR results
                 ocr_data = {
@@ -192,7 +192,7 @@ async def scan_card(image_file: UploadFile = File(...)):
                     from service.MRZExtractor import MRZExtractor
                 
                     # Initialize MRZ extractor service
-                    mrz_extractor = MRZExtractor()
+                    mrz_extractor = MRZExtractor.get_default()
                     
                     # Extract MRZ using service
                     mrz_result = mrz_extractor.extract_mrz_from_bytes(contents)
@@ -203,13 +203,13 @@ async def scan_card(image_file: UploadFile = File(...)):
                 from service.card.OCR_CCCD_2025_NEW import OCR_CCCD_2025_NEW
                 ocr_processor = OCR_CCCD_2025_NEW()
                
-                ocr_result = ocr_processor.process_image(temp_path)
+                ocr_result = ocr_processor.process_image(image_bgr)
                 
                 # Process MRZ for back side only
                
                 if 'back' in detected_label:
                         from service.MRZExtractor import MRZExtractor
-                        mrz_extractor = MRZExtractor()
+                        mrz_extractor = MRZExtractor.get_default()
                         # Extract MRZ using service
                         mrz_result = mrz_extractor.extract_mrz_from_bytes(contents)
 
@@ -239,9 +239,6 @@ async def scan_card(image_file: UploadFile = File(...)):
                         "date_of_issue": ocr_result.get("cdate_of_issue", "")
                     })
         
-        # Clean up temp file
-        image_handler.cleanup_temp(temp_path)
-        
         # Calculate timing
         end_time = time.time()
         elapsed_time = round(end_time - start_time, 3)
@@ -36,12 +36,12 @@ async def detect_card(file: UploadFile = File(...)):
         # Process uploaded image (handles RGBA -> RGB conversion automatically)
         upload_result = image_handler.process_upload(
             contents,
-            save_temp=True,
+            save_temp=False,  # Detector takes the decoded array directly
             format='JPEG',
             calculate_metrics=True
         )
         
-        temp_path = upload_result['temp_path']
+        image_bgr = upload_result['image_bgr']
         image_info = upload_result['info']
         quality_metrics = upload_result['metrics']
         
@@ -51,13 +51,13 @@ async def detect_card(file: UploadFile = File(...)):
         
         # Initialize detector with config
         pt_config = PtConfig()
-        cccd_detector = CCCDDetector(
+        cccd_detector = CCCDDetector.get_shared(
             pt_config.get_model("CCCD_FACE_DETECT_2025_NEW_TITLE"), 
             config
         )
         
         # Process the uploaded image
-        result = cccd_detector.process_image(temp_path, return_json=True, verbose=True)
+        result = cccd_detector.process_image(image_bgr, return_json=True, verbose=True)
         
         # Add image info and quality metrics to result
         if isinstance(result, dict):
@@ -66,9 +66,6 @@ async def detect_card(file: UploadFile = File(...)):
                 **quality_metrics
             }
         
-        # Clean up temporary file
-        image_handler.cleanup_temp(temp_path)
-        
         return result
         
     except ValueError as e:
@@ -38,7 +38,8 @@ async def mrz(file: UploadFile = File(...)):
                 content,
                 save_temp=False,  # MRZ works with bytes directly
                 format='JPEG',
-                calculate_metrics=True
+                calculate_metrics=True,
+                encode_bytes=True
             )
             
             image_info = upload_result['info']
@@ -48,18 +49,15 @@ async def mrz(file: UploadFile = File(...)):
             if image_info['converted']:
                 print(f"✓ MRZ: Converted image from {image_info['original_mode']} to {image_info['final_mode']}")
             
-            # Convert PIL image back to bytes for MRZ processing
-            import io
-            output = io.BytesIO()
-            upload_result['image'].save(output, format='JPEG', quality=95)
-            processed_content = output.getvalue()
+            # Converted image re-encoded in memory for MRZ processing
+            processed_content = upload_result['encoded_bytes']
             
         except ValueError as e:
             # Handle image processing errors
             raise HTTPException(status_code=400, detail=f"Image processing error: {str(e)}")
         
         # Initialize MRZ extractor service
-        mrz_extractor = MRZExtractor()
+        mrz_extractor = MRZExtractor.get_default()
         
         # Extract MRZ using service (with processed content)
         result = mrz_extractor.extract_mrz_from_bytes(processed_content)
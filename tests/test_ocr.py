@@ -0,0 +1,56 @@
+import numpy as np
+
+from paddleocr_onnx import OCRProcessor
+
+
+class _FakeDetection:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+    def __call__(self, image):
+        return self.boxes
+
+
+class _RecordingClassification:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, images):
+        self.calls.append([image.shape for image in images])
+        return images, [('0', 1.0)] * len(images)
+
+
+class _FakeRecognition:
+    def __call__(self, images):
+        return ['text'] * len(images), [1.0] * len(images)
+
+
+def _processor(boxes):
+    ocr = OCRProcessor.__new__(OCRProcessor)
+    ocr.detection = _FakeDetection(boxes)
+    ocr.classification = _RecordingClassification()
+    ocr.recognition = _FakeRecognition()
+    ocr.skip_classification_for_wide_crops = True
+    ocr.tall_crop_ratio = 1.5
+    return ocr
+
+
+def test_tall_crop_reaches_classifier_when_skipping_wide_crops():
+    wide = np.float32([[10, 10], [110, 10], [110, 30], [10, 30]])
+    tall = np.float32([[150, 10], [170, 10], [170, 110], [150, 110]])
+    ocr = _processor([wide, tall])
+
+    results = ocr.process_frame(np.zeros((200, 200, 3), np.uint8), draw_results=False)
+
+    assert len(results) == 2
+    # Only the tall box is classified; crop_images has already rotated it to 20x100
+    assert ocr.classification.calls == [[(20, 100, 3)]]
+
+
+def test_wide_crops_skip_classifier():
+    wide = np.float32([[10, 10], [110, 10], [110, 30], [10, 30]])
+    ocr = _processor([wide])
+
+    ocr.process_frame(np.zeros((200, 200, 3), np.uint8), draw_results=False)
+
+    assert ocr.classification.calls == []